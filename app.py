@@ -1,30 +1,282 @@
 import os
 import io
 import re
+import time
+import uuid
 import random
-import requests
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from PIL import Image
 from google import genai
 
 load_dotenv()
 from google.genai import types
+from google.genai.errors import ClientError
 from google.genai.types import GenerateContentConfig, Modality
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 
+from dedup import EventDedup
+from downloader import Downloader
+from gemini_control import AdaptiveLimiter, call_with_retry
+from identity import BotIdentity
+from image_cache import ImageCache, cache_key
+from intents import ReplyCache, local_reply
+from journal import JobJournal
+from jobs import JobScheduler, QueueFull
+from load_policy import LoadPolicy
+from metrics import Metrics
+from preprocess import normalize_images
+from progress import ProgressMessage
+from result_cache import ResultCache, result_key
+from sessions import EditSessions
+from singleflight import SingleFlight
+from thread_index import ThreadImageIndex
+from transcode import transcode_output
+
 # Configuration - set these as environment variables
 SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN")  # xoxb-...
 SLACK_APP_TOKEN = os.environ.get("SLACK_APP_TOKEN")  # xapp-...
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
+SLACK_API_URL = os.environ.get("SLACK_API_URL", "https://slack.com/api/")  # only changed to point at bench.py's stand-in
+
+# Edits run on a worker pool so Bolt's listener threads stay free
+EDIT_WORKERS = int(os.environ.get("BANANA_EDIT_WORKERS", "4"))
+EDIT_QUEUE_SIZE = int(os.environ.get("BANANA_EDIT_QUEUE_SIZE", "20"))
+
+# Images a `batch` edit works on at once (each attachment gets its own edit)
+BATCH_CONCURRENCY = int(os.environ.get("BANANA_BATCH_CONCURRENCY", "4"))
+
+# Most variants `x2`, `x3`... can ask for - each is its own Gemini call
+MAX_VARIANTS = int(os.environ.get("BANANA_MAX_VARIANTS", "4"))
+
+# Edits running at once under async_app.py, where a waiting edit is a coroutine instead of a thread
+ASYNC_EDITS = int(os.environ.get("BANANA_ASYNC_EDITS", "200"))
+
+# Fair sharing of the workers between users and channels. A 4K job costs more than a 2K one;
+# rate limits are in 2K-edits per minute per user/channel (0 = no limit).
+COST_4K = float(os.environ.get("BANANA_COST_4K", "4"))
+USER_RATE_PER_MIN = float(os.environ.get("BANANA_USER_RATE_PER_MIN", "0"))
+USER_BURST = float(os.environ.get("BANANA_USER_BURST", "8"))
+CHANNEL_RATE_PER_MIN = float(os.environ.get("BANANA_CHANNEL_RATE_PER_MIN", "0"))
+CHANNEL_BURST = float(os.environ.get("BANANA_CHANNEL_BURST", "16"))
+TENANT_WEIGHTS = os.environ.get("BANANA_TENANT_WEIGHTS", "")  # e.g. "U0123=2,C0456=0.5"
+# Per-user/channel queue gauges cover only this many of the busiest, to keep label counts bounded
+TENANT_METRICS_TOP = int(os.environ.get("BANANA_TENANT_METRICS_TOP", "20"))
+
+# Downloaded images are cached in memory, then on disk (set the dir to "" to disable)
+IMAGE_CACHE_MEMORY_MB = int(os.environ.get("BANANA_IMAGE_CACHE_MEMORY_MB", "128"))
+IMAGE_CACHE_DIR = os.environ.get("BANANA_IMAGE_CACHE_DIR", ".cache/images")
+IMAGE_CACHE_DISK_MB = int(os.environ.get("BANANA_IMAGE_CACHE_DISK_MB", "1024"))
+
+# Limits for each downloaded attachment
+DOWNLOAD_MAX_MB = int(os.environ.get("BANANA_DOWNLOAD_MAX_MB", "50"))
+DOWNLOAD_TIMEOUT = float(os.environ.get("BANANA_DOWNLOAD_TIMEOUT", "30"))
+
+# Stream Gemini's response: the acknowledgment shows live stage/elapsed time and model text,
+# and the image is uploaded as soon as it arrives
+STREAM_RESPONSES = os.environ.get("BANANA_STREAM_RESPONSES", "0") == "1"
+
+# Downscale and re-encode inputs to what the requested output size needs
+PREPROCESS_INPUTS = os.environ.get("BANANA_PREPROCESS_INPUTS", "1") == "1"
+PREPROCESS_QUALITY = int(os.environ.get("BANANA_PREPROCESS_QUALITY", "90"))
+
+# Re-encode outputs before upload: "jpeg", "webp" or "png" (upload as-is), at the best
+# quality that fits the budget. `lossless` in a prompt also attaches the original.
+OUTPUT_FORMAT = os.environ.get("BANANA_OUTPUT_FORMAT", "jpeg").lower()
+OUTPUT_MAX_KB = int(os.environ.get("BANANA_OUTPUT_MAX_KB", "3072"))
+OUTPUT_MIN_QUALITY = int(os.environ.get("BANANA_OUTPUT_MIN_QUALITY", "60"))
+TRANSCODE_WORKERS = int(os.environ.get("BANANA_TRANSCODE_WORKERS", "2"))
+
+# Reuse results for identical edits (same images, prompt and options) - off by default
+RESULT_CACHE = os.environ.get("BANANA_RESULT_CACHE", "0") == "1"
+RESULT_CACHE_TTL = int(os.environ.get("BANANA_RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_MB = int(os.environ.get("BANANA_RESULT_CACHE_MB", "256"))
+
+# How many model chat replies to remember for repeated messages
+CHAT_CACHE_SIZE = int(os.environ.get("BANANA_CHAT_CACHE_SIZE", "500"))
+
+# Ignore Slack redeliveries of events we've already handled (set a path to survive restarts)
+DEDUP_WINDOW = int(os.environ.get("BANANA_DEDUP_WINDOW", "600"))
+DEDUP_PATH = os.environ.get("BANANA_DEDUP_PATH", "")
+
+# Metrics: Prometheus endpoint on localhost (0 = off) and a JSONL log of stage timings ("" = off)
+METRICS_PORT = int(os.environ.get("BANANA_METRICS_PORT", "0"))
+METRICS_LOG = os.environ.get("BANANA_METRICS_LOG", "")
+
+# Latest image per thread, persisted so restarts stay warm (set to "" to keep in memory only)
+THREAD_INDEX_PATH = os.environ.get("BANANA_THREAD_INDEX_PATH", ".cache/thread_index.json")
+# A channel thread's indexed image is used as-is for this many seconds after it was recorded; after
+# that Slack is asked for anything newer (posted without a mention, so we never saw it).
+# DMs and the bot's own uploads are always used as-is.
+THREAD_INDEX_TRUST_SECONDS = float(os.environ.get("BANANA_THREAD_INDEX_TRUST_SECONDS", "60"))
+
+# Keep each thread's edits as Gemini conversation history, so a follow-up sees the earlier turns
+# and only sends its prompt (images go up once, to Gemini's Files API). A session starts at a
+# thread's first follow-up, keeps its last SESSION_MAX_TURNS edits and expires after SESSION_TTL
+# seconds idle - Gemini deletes uploaded files after 48 hours.
+EDIT_SESSIONS = os.environ.get("BANANA_EDIT_SESSIONS", "1") == "1"
+SESSION_MAX_TURNS = int(os.environ.get("BANANA_SESSION_MAX_TURNS", "6"))
+SESSION_MAX_THREADS = int(os.environ.get("BANANA_SESSION_MAX_THREADS", "500"))
+SESSION_TTL = int(os.environ.get("BANANA_SESSION_TTL", "21600"))
+
+# Multi-process mode (cluster.py): one Socket Mode process queues edits in a SQLite file and
+# worker processes (0 = one per CPU) lease them. A lease not renewed within the visibility
+# timeout goes back to the queue; a job is dropped after that many leases.
+PROCESSES = int(os.environ.get("BANANA_PROCESSES", "0"))
+QUEUE_PATH = os.environ.get("BANANA_QUEUE_PATH", ".cache/queue.db")
+QUEUE_VISIBILITY_TIMEOUT = float(os.environ.get("BANANA_QUEUE_VISIBILITY_TIMEOUT", "60"))
+QUEUE_MAX_ATTEMPTS = int(os.environ.get("BANANA_QUEUE_MAX_ATTEMPTS", "3"))
+
+# Journal of accepted edits, so ones interrupted by a crash or restart are resumed on startup
+# (set to "" to turn off). Records are fsynced in batches every JOURNAL_FLUSH_MS. An edit still
+# unfinished after RESUME_MAX_ATTEMPTS restarts is given up on, in case it's what keeps crashing us.
+JOURNAL_DIR = os.environ.get("BANANA_JOURNAL_DIR", ".cache/journal")
+JOURNAL_FLUSH_MS = int(os.environ.get("BANANA_JOURNAL_FLUSH_MS", "20"))
+RESUME_MAX_ATTEMPTS = int(os.environ.get("BANANA_RESUME_MAX_ATTEMPTS", "3"))
 
 # Initialize Slack app
-app = App(token=SLACK_BOT_TOKEN)
+# Bolt builds the client from the token (a client of our own makes it warn the token goes unused);
+# bot_identity checks the token at startup, by when the client points at SLACK_API_URL
+app = App(token=SLACK_BOT_TOKEN, token_verification_enabled=False)
+app.client.base_url = SLACK_API_URL
 
 # Initialize Gemini client
 gemini = genai.Client(api_key=GEMINI_API_KEY)
 
 MODEL = "gemini-3-pro-image-preview"
+CHAT_MODEL = "gemini-2.0-flash"  # faster model for chat
+
+# Client-side limits on Gemini calls: in-flight requests adapt between 1 and the max,
+# transient errors are retried with backoff, and each call has an overall deadline (seconds)
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("BANANA_GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MAX_ATTEMPTS = int(os.environ.get("BANANA_GEMINI_MAX_ATTEMPTS", "4"))
+EDIT_DEADLINE = float(os.environ.get("BANANA_EDIT_DEADLINE", "180"))
+CHAT_DEADLINE = float(os.environ.get("BANANA_CHAT_DEADLINE", "20"))
+
+edit_limiter = AdaptiveLimiter(MODEL, initial=min(4, GEMINI_MAX_CONCURRENCY), max_limit=GEMINI_MAX_CONCURRENCY, latency_tolerance=3.0)
+chat_limiter = AdaptiveLimiter(CHAT_MODEL, initial=min(4, GEMINI_MAX_CONCURRENCY), max_limit=GEMINI_MAX_CONCURRENCY * 2)
+
+# Under load - this many edits queued, or edits averaging this many seconds at Gemini (0 = don't
+# check) - new 4K edits run at 2K and chat goes to a lighter model, with a note to the user.
+# Load counts as back to normal once both are under 70% of their thresholds.
+DEGRADE_QUEUE_DEPTH = int(os.environ.get("BANANA_DEGRADE_QUEUE_DEPTH", "10"))
+DEGRADE_LATENCY = float(os.environ.get("BANANA_DEGRADE_LATENCY", "90"))
+LIGHT_CHAT_MODEL = os.environ.get("BANANA_LIGHT_CHAT_MODEL", "gemini-2.0-flash-lite")
+
+light_chat_limiter = AdaptiveLimiter(LIGHT_CHAT_MODEL, initial=min(4, GEMINI_MAX_CONCURRENCY), max_limit=GEMINI_MAX_CONCURRENCY * 2)
+
+# Scheduler cost of each output resolution
+RESOLUTION_COST = {"2K": 1.0, "4K": COST_4K}
+
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """Parse "ID=weight,ID=weight" into a dict."""
+    weights = {}
+    for item in spec.split(","):
+        if "=" in item:
+            tenant, weight = item.split("=", 1)
+            weights[tenant.strip()] = float(weight)
+    return weights
+
+
+def busiest_tenants(scheduler) -> list[tuple[str, dict]]:
+    """The TENANT_METRICS_TOP users/channels with the most queued and longest waits, from tenant_stats()."""
+    stats = scheduler.tenant_stats()
+    return sorted(stats.items(), key=lambda item: (item[1]["queued"], item[1]["oldest_wait"]), reverse=True)[:TENANT_METRICS_TOP]
+
+
+def tenant_gauges(scheduler):
+    """Register per-tenant queue gauges for a scheduler (async_app.py points them at its own)."""
+    for name, field in (("banana_tenant_queued", "queued"), ("banana_tenant_oldest_wait_seconds", "oldest_wait"),
+                        ("banana_tenant_avg_wait_seconds", "avg_wait")):
+        metrics.gauge_set(name, lambda field=field: [({"tenant": tenant}, round(s[field], 3)) for tenant, s in busiest_tenants(scheduler)])
+
+
+# Per-stage timers, byte counters and queue gauges
+metrics = Metrics(log_path=METRICS_LOG or None)
+
+# Worker pool for image edits
+scheduler = JobScheduler(
+    workers=EDIT_WORKERS,
+    max_queue=EDIT_QUEUE_SIZE,
+    weights=parse_weights(TENANT_WEIGHTS),
+    user_rate=USER_RATE_PER_MIN / 60,
+    user_burst=USER_BURST,
+    channel_rate=CHANNEL_RATE_PER_MIN / 60,
+    channel_burst=CHANNEL_BURST,
+)
+
+# Cache of raw image bytes, keyed by Slack file ID
+image_cache = ImageCache(
+    memory_bytes=IMAGE_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_dir=IMAGE_CACHE_DIR,
+    disk_bytes=IMAGE_CACHE_DISK_MB * 1024 * 1024,
+)
+
+# Shared connection pool for Slack CDN downloads
+downloader = Downloader(max_bytes=DOWNLOAD_MAX_MB * 1024 * 1024, timeout=DOWNLOAD_TIMEOUT)
+
+# Results of recent edits, if enabled
+result_cache = ResultCache(max_bytes=RESULT_CACHE_MB * 1024 * 1024, ttl=RESULT_CACHE_TTL) if RESULT_CACHE else None
+
+# When to degrade new work - cluster.py and async_app.py point it at their own queue and limiter
+load_policy = LoadPolicy(
+    depth=scheduler.depth,
+    latency=lambda: edit_limiter.avg_latency if edit_limiter.in_flight else None,
+    max_depth=DEGRADE_QUEUE_DEPTH,
+    max_latency=DEGRADE_LATENCY,
+)
+
+metrics.gauge("banana_queue_depth", scheduler.depth)
+metrics.gauge("banana_workers_busy", scheduler.busy)
+tenant_gauges(scheduler)
+metrics.gauge("banana_gemini_concurrency_limit", lambda: int(edit_limiter.limit), model=MODEL)
+metrics.gauge("banana_gemini_concurrency_limit", lambda: int(chat_limiter.limit), model=CHAT_MODEL)
+metrics.gauge("banana_gemini_in_flight", lambda: edit_limiter.in_flight, model=MODEL)
+metrics.gauge("banana_gemini_in_flight", lambda: chat_limiter.in_flight, model=CHAT_MODEL)
+metrics.gauge("banana_gemini_concurrency_limit", lambda: int(light_chat_limiter.limit), model=LIGHT_CHAT_MODEL)
+metrics.gauge("banana_gemini_in_flight", lambda: light_chat_limiter.in_flight, model=LIGHT_CHAT_MODEL)
+metrics.gauge("banana_load_pressure", lambda: int(load_policy.pressure() is not None))
+metrics.gauge("banana_image_cache_bytes", lambda: image_cache.memory.size, tier="memory")
+metrics.describe("banana_stage_seconds", "Time spent in each pipeline stage")
+metrics.describe("banana_queue_wait_seconds", "Time jobs spent waiting for a worker")
+metrics.describe("banana_bytes_total", "Bytes downloaded, uploaded and saved by preprocessing")
+metrics.describe("banana_degraded_total", "Requests given a cheaper resolution or model because of load")
+
+# Recent model chat replies, for repeated small talk the templates don't cover
+chat_cache = ReplyCache(max_entries=CHAT_CACHE_SIZE)
+
+# Event IDs we've already handled
+event_dedup = EventDedup(window=DEDUP_WINDOW, path=DEDUP_PATH or None)
+
+# Edits currently waiting on Gemini, so identical ones can share a call
+inflight_edits = SingleFlight()
+
+# Slack calls and downloads a job runs alongside its own work (the acknowledgment, fetching images)
+slack_pool = ThreadPoolExecutor(max_workers=EDIT_WORKERS * 2, thread_name_prefix="banana-slack")
+
+# Output encoding is CPU-bound, so it gets its own small pool
+transcode_pool = ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS, thread_name_prefix="banana-transcode")
+
+# Latest image in each thread we've seen
+thread_index = ThreadImageIndex(path=THREAD_INDEX_PATH or None)
+
+# Gemini conversation history for threads with follow-ups
+edit_sessions = EditSessions(max_sessions=SESSION_MAX_THREADS, max_turns=SESSION_MAX_TURNS, ttl=SESSION_TTL) if EDIT_SESSIONS else None
+if edit_sessions is not None:
+    metrics.gauge("banana_edit_sessions", lambda: len(edit_sessions))
+
+# Shared queue that submit_edit_job hands edits to instead of the scheduler - set by cluster.py
+job_queue = None
+
+# Where each accepted edit got to - cluster.py turns this off, its queue already survives restarts.
+# Like the scheduler's workers and the thread index's flusher, it starts on first use.
+journal = JobJournal(JOURNAL_DIR, flush_interval=JOURNAL_FLUSH_MS / 1000) if JOURNAL_DIR else None
+
+# Bot user/team IDs, resolved once at startup
+bot_identity = BotIdentity()
 
 # Random acknowledgments for instant feedback
 ACKNOWLEDGMENTS = [
@@ -197,27 +449,84 @@ When responding:
 
 
 def chat_response(message: str) -> str:
-    """Get a text-only chat response from the model."""
-    response = gemini.models.generate_content(
-        model="gemini-2.0-flash",  # faster model for chat
-        contents=[message],
-        config=GenerateContentConfig(
-            response_modalities=[Modality.TEXT],
-            system_instruction=CHAT_SYSTEM_PROMPT
+    """Get a text-only chat response: from templates for small talk, else from the model (cached)."""
+    reply = quick_chat_reply(message)
+    if reply:
+        return reply
+    
+    model, limiter = CHAT_MODEL, chat_limiter
+    reason = load_policy.pressure()
+    if reason:
+        model, limiter = LIGHT_CHAT_MODEL, light_chat_limiter
+        metrics.inc("banana_degraded_total", kind="chat_model", reason=reason)
+    
+    with metrics.timer("gemini", model=model):
+        response = call_with_retry(
+            lambda timeout: gemini.models.generate_content(model=model, contents=[message], config=chat_config(timeout)),
+            limiter, deadline=CHAT_DEADLINE, max_attempts=GEMINI_MAX_ATTEMPTS
         )
-    )
+    text = chat_reply_text(message, response)
+    return f"{text}\n{DEGRADED_NOTES['chat_model']}" if reason else text
+
+
+# What we tell people when load made us cut a corner
+DEGRADED_NOTES = {
+    "resolution": "It's busy right now, so this one will be 2K instead of 4K.",
+    "chat_model": "_(It's busy right now, so a lighter model answered this one.)_",
+}
+
+
+def degrade_job(job: dict) -> str | None:
+    """Under load, run a new 4K edit at 2K. Returns the note for the user if it did."""
+    if job["resolution"] != "4K":
+        return None
+    reason = load_policy.pressure()
+    if not reason:
+        return None
+    job["resolution"] = "2K"
+    metrics.inc("banana_degraded_total", kind="resolution", reason=reason)
+    return DEGRADED_NOTES["resolution"]
+
+
+def quick_chat_reply(message: str) -> str | None:
+    """A reply from the templates or the chat cache, or None if the model has to answer."""
+    reply = local_reply(message)
+    if reply:
+        metrics.inc("banana_chat_replies_total", source="local")
+        return reply
+    
+    reply = chat_cache.get(message)
+    if reply:
+        metrics.inc("banana_chat_replies_total", source="cache")
+        return reply
     
+    metrics.inc("banana_chat_replies_total", source="model")
+    return None
+
+
+def chat_config(timeout: float) -> GenerateContentConfig:
+    return GenerateContentConfig(
+        response_modalities=[Modality.TEXT],
+        system_instruction=CHAT_SYSTEM_PROMPT,
+        http_options=types.HttpOptions(timeout=int(timeout * 1000))
+    )
+
+
+def chat_reply_text(message: str, response) -> str:
+    """Pull the reply out of a chat model response, caching it for next time."""
     for part in response.parts:
         if part.text:
+            chat_cache.put(message, part.text)
             return part.text
     
     return "🍌"
 
 
-def parse_options(prompt: str) -> tuple[str, str, str | None]:
-    """Parse resolution and aspect ratio from prompt. Returns (clean_prompt, resolution, aspect_ratio)."""
+def parse_options(prompt: str) -> tuple[str, str, str | None, dict]:
+    """Parse resolution, aspect ratio and flags from prompt. Returns (clean_prompt, resolution, aspect_ratio, flags)."""
     resolution = "2K"
     aspect_ratio = None
+    flags = {}
     
     # Aspect ratio mappings
     ratio_shortcuts = {
@@ -232,49 +541,185 @@ def parse_options(prompt: str) -> tuple[str, str, str | None]:
     
     for word in words:
         lower = word.lower()
+        # Words that also turn up in ordinary prompts ("add fresh flowers", "a batch of
+        # cookies") only count as options before the prompt proper starts
+        leading = not clean_words
         if lower == "4k" and resolution == "2K":
             resolution = "4K"
         elif lower in ratio_shortcuts and aspect_ratio is None:
             aspect_ratio = ratio_shortcuts[lower]
         elif lower in valid_ratios and aspect_ratio is None:
             aspect_ratio = lower
+        elif lower == "fresh" and leading and "fresh" not in flags:
+            flags["fresh"] = True  # skip the result cache
+        elif lower == "lossless" and "lossless" not in flags:
+            flags["lossless"] = True  # attach the untouched model output too
+        elif lower == "batch" and leading and "batch" not in flags:
+            flags["batch"] = True  # edit each image on its own instead of merging them
+        elif re.fullmatch(r"[x×][2-9]", lower) and "variants" not in flags:
+            flags["variants"] = min(int(lower[1]), MAX_VARIANTS)  # several takes on the same edit
         else:
             clean_words.append(word)
     
-    return " ".join(clean_words).strip(), resolution, aspect_ratio
+    return " ".join(clean_words).strip(), resolution, aspect_ratio, flags
 
 
-def download_slack_image(url: str) -> Image.Image:
-    """Download an image from Slack's CDN and return as PIL Image."""
-    response = requests.get(
-        url,
-        headers={"Authorization": f"Bearer {SLACK_BOT_TOKEN}"}
-    )
-    response.raise_for_status()
-    return Image.open(io.BytesIO(response.content))
+# Slack file downloads need the bot token
+SLACK_AUTH_HEADERS = {"Authorization": f"Bearer {SLACK_BOT_TOKEN}"}
+
+# Formats Gemini accepts as-is; anything else gets converted to PNG
+GEMINI_IMAGE_TYPES = {"image/png", "image/jpeg", "image/webp", "image/heic", "image/heif"}
+
+
+def sniff_mime_type(data: bytes) -> str | None:
+    """Work out an image's MIME type from its first few bytes."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp":
+        brand = data[8:12]
+        if brand in (b"heic", b"heix", b"heim", b"heis"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    return None
+
+
+def as_gemini_image(data: bytes) -> tuple[bytes, str]:
+    """Return (bytes, mime_type) ready for Gemini, only decoding with PIL if the format needs converting."""
+    mime_type = sniff_mime_type(data)
+    if mime_type in GEMINI_IMAGE_TYPES:
+        return data, mime_type
+    
+    # GIF, BMP, TIFF etc. - convert to PNG
+    image = Image.open(io.BytesIO(data))
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA")
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue(), "image/png"
+
+
+def download_slack_images(urls: list[str]) -> list[tuple[bytes, str]]:
+    """Download images from Slack's CDN (or the image cache) in parallel. Returns [(bytes, mime_type)]."""
+    keys, blobs, missing = cached_images(urls)
+    
+    # Fetch everything that wasn't cached at once
+    if missing:
+        with metrics.timer("download", files=len(missing)):
+            fetched = downloader.fetch_all([urls[i] for i in missing], headers=SLACK_AUTH_HEADERS)
+        store_downloads(keys, blobs, missing, fetched)
+    
+    return [as_gemini_image(data) for data in blobs]
+
+
+def cached_images(urls: list[str]) -> tuple[list[str], list[bytes | None], list[int]]:
+    """Look urls up in the image cache. Returns (keys, blobs, indexes of the ones still to download)."""
+    keys = [cache_key(url) for url in urls]
+    blobs = [image_cache.get(key) for key in keys]
+    missing = [i for i, data in enumerate(blobs) if data is None]
+    metrics.inc("banana_image_cache_total", len(urls) - len(missing), result="hit")
+    metrics.inc("banana_image_cache_total", len(missing), result="miss")
+    return keys, blobs, missing
+
 
+def store_downloads(keys: list[str], blobs: list[bytes | None], missing: list[int], fetched: list[bytes]):
+    """Cache freshly downloaded files and fill them into blobs."""
+    for i, data in zip(missing, fetched):
+        metrics.inc("banana_bytes_total", len(data), kind="download")
+        image_cache.put(keys[i], data)
+        blobs[i] = data
 
-def edit_image(images: list[Image.Image], prompt: str, resolution: str = "2K", aspect_ratio: str | None = None) -> tuple[bytes | None, str | None, str | None]:
-    """Edit image(s) with a prompt. Returns (image_data, text_response, mime_type)."""
+
+def remember_upload(upload_response, contents: list[bytes], channel_id: str, thread_ts: str):
+    """Cache and index files we just uploaded, so the next thread edit skips the lookup and download.
+
+    `contents` are the uploaded bytes in upload order; the last file becomes the thread's latest image.
+    """
+    files = upload_response.get("files") or [upload_response.get("file") or {}]
+    for f, data in zip(files, contents):
+        if f.get("id"):
+            image_cache.put(f["id"], data)
+        if f.get("url_private"):
+            thread_index.record(channel_id, thread_ts, f["url_private"], upload_ts(f, channel_id), own=True)
+
+
+def upload_ts(f: dict, channel_id: str) -> str:
+    """Slack ts of the message a file we uploaded was shared in, or its upload time if the share isn't listed yet.
+
+    Either is on Slack's clock, so it orders correctly against the thread's other messages."""
+    for shares in (f.get("shares") or {}).values():
+        for share in shares.get(channel_id, []):
+            return share["ts"]
+    if f.get("timestamp"):
+        return str(f["timestamp"])
+    return f"{time.time():.6f}"
+
+
+def is_duplicate_event(event, body) -> bool:
+    """True if Slack already delivered this event (a retry, or the same message arriving twice)."""
+    keys = [body.get("event_id"), event.get("client_msg_id")]
+    if event.get("channel") and event.get("ts"):
+        keys.append(f"{event['channel']}:{event['ts']}")
+    duplicate = event_dedup.check_and_add(keys)
+    metrics.inc("banana_events_total", type=event.get("type"), duplicate=str(duplicate).lower())
+    return duplicate
+
+
+def remember_event_images(event):
+    """Index images attached to an incoming message under the thread they belong to."""
+    image_urls = image_urls_from_files(event.get("files", []))
+    if image_urls:
+        thread_ts = event.get("thread_ts") or event.get("ts")
+        thread_index.record(event["channel"], thread_ts, image_urls[-1], event["ts"])
+
+
+def edit_image(images: list[tuple[bytes, str]], prompt: str, resolution: str = "2K", aspect_ratio: str | None = None, progress=None) -> tuple[bytes | None, str | None, str | None]:
+    """Edit image(s) with a prompt. Images are (bytes, mime_type). Returns (image_data, text_response, mime_type).
     
-    # Build contents: prompt first, then all images
-    contents = [prompt] + images
+    With a ProgressMessage and streaming enabled, the response is streamed into it as it arrives."""
+    contents = edit_contents(images, prompt)
     
-    # Build image config
+    with metrics.timer("gemini", model=MODEL, resolution=resolution):
+        if progress and STREAM_RESPONSES:
+            return call_with_retry(
+                lambda timeout: stream_edit(contents, edit_config(resolution, aspect_ratio, timeout), progress),
+                edit_limiter, deadline=EDIT_DEADLINE, max_attempts=GEMINI_MAX_ATTEMPTS
+            )
+        
+        response = call_with_retry(
+            lambda timeout: gemini.models.generate_content(model=MODEL, contents=contents, config=edit_config(resolution, aspect_ratio, timeout)),
+            edit_limiter, deadline=EDIT_DEADLINE, max_attempts=GEMINI_MAX_ATTEMPTS
+        )
+    
+    return edit_result(response)
+
+
+def edit_contents(images: list[tuple[bytes, str]], prompt: str) -> list:
+    """Prompt first, then all images as raw bytes (no PIL re-encode)."""
+    return [prompt] + [types.Part.from_bytes(data=data, mime_type=mime_type) for data, mime_type in images]
+
+
+def edit_config(resolution: str, aspect_ratio: str | None, timeout: float) -> GenerateContentConfig:
     image_config_params = {"image_size": resolution}
     if aspect_ratio:
         image_config_params["aspect_ratio"] = aspect_ratio
     
-    response = gemini.models.generate_content(
-        model=MODEL,
-        contents=contents,
-        config=GenerateContentConfig(
-            response_modalities=[Modality.TEXT, Modality.IMAGE],
-            image_config=types.ImageConfig(**image_config_params),
-            tools=[{"google_search": {}}]  # Enable search grounding
-        )
+    return GenerateContentConfig(
+        response_modalities=[Modality.TEXT, Modality.IMAGE],
+        image_config=types.ImageConfig(**image_config_params),
+        tools=[{"google_search": {}}],  # Enable search grounding
+        http_options=types.HttpOptions(timeout=int(timeout * 1000))
     )
-    
+
+
+def edit_result(response) -> tuple[bytes | None, str | None, str | None]:
+    """Pull (image_data, text_response, mime_type) out of a model response."""
     text_response = None
     image_data = None
     mime_type = None
@@ -289,201 +734,710 @@ def edit_image(images: list[Image.Image], prompt: str, resolution: str = "2K", a
     return image_data, text_response, mime_type
 
 
-def find_last_image_in_thread(client, channel_id: str, thread_ts: str, bot_user_id: str) -> str | None:
+def stream_edit(contents: list, config: GenerateContentConfig, progress) -> tuple[bytes | None, str | None, str | None]:
+    """Stream an edit, passing text and the finished image to progress as soon as they arrive."""
+    text_response = None
+    image_data = None
+    mime_type = None
+    
+    # call_with_retry starts the stream over after a failure; don't show its text twice
+    progress.restart()
+    progress.stage("Waiting for Gemini")
+    try:
+        for chunk in gemini.models.generate_content_stream(model=MODEL, contents=contents, config=config):
+            progress.stage("Generating")
+            for part in chunk.parts or []:
+                if part.text:
+                    text_response = (text_response or "") + part.text
+                    progress.text(part.text)
+                elif part.inline_data:
+                    image_data = part.inline_data.data
+                    mime_type = part.inline_data.mime_type
+                    progress.image(image_data, mime_type, text_response)
+    except Exception:
+        # Once we have the image, a dropped stream only costs us some trailing text
+        if image_data is None:
+            raise
+    
+    return image_data, text_response, mime_type
+
+
+def find_last_image_in_thread(client, channel_id: str, thread_ts: str, dm: bool = False) -> str | None:
     """Find the most recent image in a thread (bot-posted or user-uploaded)."""
+    entry = thread_index.get(channel_id, thread_ts)
+    if entry and index_trusted(entry, dm):
+        metrics.inc("banana_thread_index_total", result="hit")
+        return entry["url"]
+    
+    # Page through the thread and index what we find. conversations.replies only pages
+    # oldest-first, so keep the newest image seen. An older index entry is only checked
+    # from its image on, which is usually one short page.
     try:
-        result = client.conversations_replies(channel=channel_id, ts=thread_ts)
-        messages = result.get("messages", [])
-        
-        # Go through messages in reverse (most recent first)
-        for msg in reversed(messages):
-            files = msg.get("files", [])
-            for f in files:
-                if f.get("mimetype", "").startswith("image/"):
-                    return f.get("url_private")
-        
-        return None
+        latest = entry
+        cursor = None
+        with metrics.timer("thread_check" if entry else "thread_lookup"):
+            while True:
+                result = client.conversations_replies(channel=channel_id, ts=thread_ts, oldest=entry and entry["ts"], limit=200, cursor=cursor)
+                latest = newest_image(result.get("messages", []), latest)
+                cursor = (result.get("response_metadata") or {}).get("next_cursor")
+                if not cursor:
+                    break
     except Exception as e:
         print(f"Error fetching thread: {e}")
+        latest = entry
+    
+    metrics.inc("banana_thread_index_total", result="miss" if not entry else "checked" if latest is entry else "stale")
+    if latest is None:
         return None
+    # Re-recording a checked entry restarts its trust window
+    thread_index.record(channel_id, thread_ts, latest["url"], latest["ts"])
+    return latest["url"]
 
 
-@app.event("app_mention")
-def handle_mention(event, client, say):
-    """Handle @mentions - IMAGE EDITING."""
-    user_id = event["user"]
-    channel_id = event["channel"]
-    thread_ts = event.get("thread_ts") or event.get("ts")  # Reply in thread or start new one
-    text = event.get("text", "")
-    files = event.get("files", [])
-    
-    # Get bot's own user ID for thread scanning
-    bot_user_id = client.auth_test()["user_id"]
-    
-    # Remove the bot mention from the text to get the prompt
-    prompt = re.sub(r"<@[A-Z0-9]+>", "", text).strip()
+def index_trusted(entry: dict, dm: bool) -> bool:
+    """Whether a thread-index entry can be used without asking Slack for anything newer.
+
+    We see every message in a DM, and the bot's own upload is the newest image in its
+    thread until someone replies. Otherwise only a recently recorded entry is trusted."""
+    return dm or entry.get("own", False) or time.time() - entry.get("seen", 0) < THREAD_INDEX_TRUST_SECONDS
+
+
+def newest_image(messages: list[dict], latest: dict | None) -> dict | None:
+    """The newest image in a page of thread messages, or `latest` if that's newer. Returns {"url", "ts"}."""
+    for msg in reversed(messages):
+        image_urls = image_urls_from_files(msg.get("files", []))
+        if image_urls:
+            if latest is None or float(msg["ts"]) > float(latest["ts"]):
+                latest = {"url": image_urls[-1], "ts": msg["ts"]}
+            break
+    return latest
+
+
+def prepare_and_edit(images: list[tuple[bytes, str]], prompt: str, resolution: str, aspect_ratio: str | None, fresh: bool = False, progress=None) -> tuple[bytes | None, str | None, str | None]:
+    """Preprocess inputs and run edit_image, answering from the result cache or an identical in-flight edit when we can."""
+    key = result_key(images, prompt, resolution, aspect_ratio)
+    if result_cache and not fresh:
+        cached = result_cache.get(key)
+        metrics.inc("banana_result_cache_total", result="hit" if cached else "miss")
+        if cached:
+            return cached
     
-    if not prompt:
-        # Empty mention - respond briefly
-        try:
-            response = chat_response("Someone just mentioned me with no message")
-            say(f"🍌 {response}", thread_ts=thread_ts)
-        except:
-            say("🍌 Hey! What's up?", thread_ts=thread_ts)
-        return
+    # Identical edits running at the same time share one Gemini call
+    result, shared = inflight_edits.do(key, _preprocess_and_edit, images, prompt, resolution, aspect_ratio, progress)
+    if shared:
+        metrics.inc("banana_edits_coalesced_total")
+    elif result_cache and result[0]:
+        result_cache.put(key, result)
+    return result
+
+
+def _preprocess_and_edit(images: list[tuple[bytes, str]], prompt: str, resolution: str, aspect_ratio: str | None, progress=None) -> tuple[bytes | None, str | None, str | None]:
+    if PREPROCESS_INPUTS:
+        if progress:
+            progress.stage("Preparing images")
+        images = preprocess_images(images, resolution, aspect_ratio)
     
-    # Parse resolution and aspect ratio from prompt
-    prompt, resolution, aspect_ratio = parse_options(prompt)
+    return edit_image(images, prompt, resolution, aspect_ratio, progress)
+
+
+def preprocess_images(images: list[tuple[bytes, str]], resolution: str, aspect_ratio: str | None) -> list[tuple[bytes, str]]:
+    """Shrink oversized inputs to what the output resolution needs."""
+    with metrics.timer("preprocess", resolution=resolution):
+        images, saved = normalize_images(images, resolution, aspect_ratio, PREPROCESS_QUALITY)
+    metrics.inc("banana_bytes_total", saved, kind="preprocess_saved")
+    print(f"Preprocessed {len(images)} image(s) for {resolution}: saved {saved // 1024}KB")
+    return images
+
+
+def image_urls_from_files(files: list[dict]) -> list[str]:
+    """Collect the private URLs of all image attachments."""
+    image_urls = []
+    for f in files:
+        if f.get("mimetype", "").startswith("image/"):
+            image_urls.append(f.get("url_private"))
+    return image_urls
+
+
+# Upload filename extension for each output type
+OUTPUT_EXTENSIONS = {"image/jpeg": "jpg", "image/webp": "webp", "image/png": "png"}
+
+
+def upload_result(client, job: dict, image_data: bytes, text: str | None, mime_type: str | None):
+    """Upload an edited image to the job's thread with a caption."""
+    upload_gallery(client, job, [(image_data, text, mime_type)])
+
+
+def upload_gallery(client, job: dict, results: list[tuple[bytes, str | None, str | None]]):
+    """Upload one or more takes on an edit, (image_data, text, mime_type) each, as a single message."""
+    with metrics.timer("transcode", format=OUTPUT_FORMAT, resolution=job["resolution"]):
+        groups = list(transcode_pool.map(lambda result: encode_output(job, result[0], result[2]), results))
+    upload_encoded(client, job, next((text for _, text, _ in results if text), None), groups)
+
+
+def upload_encoded(client, job: dict, text: str | None, groups: list[list[tuple[bytes, str | None]]]):
+    """Upload already-transcoded takes (encode_output's files for each) as a single message."""
+    if len(groups) > 1:
+        job = dict(job, part=f"{len(groups)} variants")
+    comment = upload_comment(job, text)
+    files = [f for group in groups for f in group]
     
-    # Build label for output
+    with metrics.timer("upload", resolution=job["resolution"]):
+        upload = client.files_upload_v2(
+            channel=job["channel_id"],
+            thread_ts=job["thread_ts"],
+            file_uploads=gallery_uploads(groups),
+            initial_comment=comment
+        )
+    journal_record(job, "uploaded")
+    metrics.inc("banana_bytes_total", sum(len(data) for data, _ in files), kind="upload")
+    remember_upload(upload, [data for data, _ in files], job["channel_id"], job["thread_ts"])
+
+
+def upload_comment(job: dict, text: str | None) -> str:
+    """Caption for an edit: options, who asked (outside DMs), the prompt and any model text."""
     labels = []
-    if resolution == "4K":
+    if job["resolution"] == "4K":
         labels.append("4K")
-    if aspect_ratio:
-        labels.append(aspect_ratio)
+    if job["aspect_ratio"]:
+        labels.append(job["aspect_ratio"])
+    if job.get("part"):
+        labels.insert(0, job["part"])
     label_str = f" ({', '.join(labels)})" if labels else ""
     
-    # Collect ALL images from attached files
-    image_urls = []
-    for f in files:
-        if f.get("mimetype", "").startswith("image/"):
-            image_urls.append(f.get("url_private"))
+    if job["source"] == "dm":
+        comment = f"🍌 *Edit{label_str}*: _{job['prompt']}_"
+    else:
+        comment = f"🍌 *Edit{label_str}* by <@{job['user_id']}>: _{job['prompt']}_"
+    if text:
+        comment += f"\n\n{text}"
+    return comment
+
+
+def encode_output(job: dict, image_data: bytes, mime_type: str | None) -> list[tuple[bytes, str | None]]:
+    """Transcode an edit for upload. Returns [(bytes, mime_type)] - the lossless original is appended if asked for."""
+    output, output_type = transcode_output(image_data, mime_type, OUTPUT_FORMAT, OUTPUT_MAX_KB * 1024, OUTPUT_MIN_QUALITY)
+    if output is not image_data:
+        saved = len(image_data) - len(output)
+        metrics.inc("banana_bytes_total", saved, kind="transcode_saved")
+        print(f"Transcoded {len(image_data) // 1024}KB {mime_type} to {len(output) // 1024}KB {output_type} ({saved // 1024}KB saved)")
+    
+    # Lossless original goes last, so the next edit in the thread starts from it
+    files = [(output, output_type)]
+    if job["flags"].get("lossless") and output is not image_data:
+        files.append((image_data, mime_type))
+    return files
+
+
+def file_uploads(files: list[tuple[bytes, str | None]], variant: int | None = None) -> list[dict]:
+    """files_upload_v2 entries for encode_output's files."""
+    name = f"banana-bot-edit-{variant}" if variant else "banana-bot-edit"
+    return [
+        {"content": data, "filename": f"{name}{'-lossless' if i else ''}.{OUTPUT_EXTENSIONS.get(mime_type, 'png')}"}
+        for i, (data, mime_type) in enumerate(files)
+    ]
+
+
+def gallery_uploads(groups: list[list[tuple[bytes, str | None]]]) -> list[dict]:
+    """files_upload_v2 entries for several encode_output results, numbered if there's more than one."""
+    if len(groups) == 1:
+        return file_uploads(groups[0])
+    return [entry for n, files in enumerate(groups, 1) for entry in file_uploads(files, variant=n)]
+
+
+# What to say when there's no image to edit and the chat model didn't answer
+NO_IMAGE_HINTS = {
+    "dm": "🍌 To edit an image, send it along with your prompt!",
+    "mention": "🍌 To edit an image, mention me and attach the image you want to change!",
+}
+
+
+def journal_record(job: dict, state: str, wait: bool = False, **data):
+    """Note a job's progress in the journal, if there is one."""
+    if journal is not None and job.get("id"):
+        journal.record(job["id"], state, wait=wait, **data)
+
+
+def job_cost(job: dict) -> float:
+    """Scheduler cost of a job: its resolution's cost, once per image for a batch."""
+    cost = RESOLUTION_COST.get(job["resolution"], 1.0)
+    if job["flags"].get("batch"):
+        cost *= max(1, len(job["image_urls"]))
+    return cost * job["flags"].get("variants", 1)
+
+
+def resume_or_give_up(job: dict) -> str | None:
+    """Count another resume of an interrupted job. Returns the message to post instead if it's been resumed too often."""
+    resumed = job["journal"].get("resumed", 0)
+    if resumed >= RESUME_MAX_ATTEMPTS:
+        # Durable before we tell anyone, or the next crash brings it back again
+        journal.record(job["id"], "closed", wait=True)
+        print(f"Giving up on job {job['id']} after {resumed} resumes")
+        return give_up_message(resumed + 1)
+    journal.record(job["id"], "resumed", wait=True)
+    return None
+
+
+def give_up_message(interrupted: int) -> str:
+    """What to post in the thread of an edit that keeps getting interrupted."""
+    return f"🍌 Sorry, I couldn't finish this edit - it was interrupted {interrupted} times. Try again, maybe at a lower resolution?"
+
+
+def resume_jobs(client):
+    """Resubmit the edits the journal says were interrupted, waiting for room in the queue."""
+    jobs = journal.unfinished() if journal is not None else []
+    if jobs:
+        print(f"Resuming {len(jobs)} interrupted edits")
+    for job in jobs:
+        give_up = resume_or_give_up(job)
+        if give_up:
+            try:
+                client.chat_postMessage(channel=job["channel_id"], thread_ts=job["thread_ts"], text=give_up)
+            except Exception as e:
+                print(f"Error posting to {job['channel_id']}: {e}")
+            continue
+        job["submitted_at"] = time.time()
+        while True:
+            try:
+                scheduler.submit(run_edit_job, job, client, user=job["user_id"], channel=job["channel_id"], cost=job_cost(job))
+                break
+            except QueueFull:
+                time.sleep(1)
+
+
+def run_edit_job(job: dict, client):
+    """Run one edit request end to end: find images, edit, upload. Runs on a worker thread."""
+    if job.get("submitted_at"):
+        metrics.observe("banana_queue_wait_seconds", time.time() - job["submitted_at"], resolution=job["resolution"])
+    with metrics.timer("total", resolution=job["resolution"], source=job["source"]):
+        _run_edit_job(job, client)
+
+
+def _run_edit_job(job: dict, client):
+    channel_id = job["channel_id"]
+    thread_ts = job["thread_ts"]
+    prompt = job["prompt"]
+    resolution = job["resolution"]
+    aspect_ratio = job["aspect_ratio"]
+    image_urls = job["image_urls"]
+    
+    def say(text: str):
+        return client.chat_postMessage(channel=channel_id, thread_ts=thread_ts, text=text)
+    
+    # The acknowledgment doesn't feed into anything, so post it while we find and fetch the images.
+    # In a thread without attachments we don't know yet whether there's an image to edit -
+    # if there isn't, the acknowledgment is turned into the chat reply below.
+    ack_text = f"🍌 {random.choice(ACKNOWLEDGMENTS)}"
+    
+    def post_ack() -> str | None:
+        try:
+            return say(ack_text)["ts"]
+        except Exception as e:
+            print(f"Error posting acknowledgment: {e}")
+            return None
+    
+    # A resumed job already has its acknowledgment, and maybe its result, from before the restart
+    resumed = job.get("journal", {})
+    journal_record(job, "started")
+    
+    def post_and_record_ack() -> str | None:
+        ts = post_ack()
+        if ts:
+            journal_record(job, "started", ack_ts=ts)
+        return ts
+    
+    ack_future = None
+    if resumed.get("ack_ts"):
+        ack_future = Future()
+        ack_future.set_result(resumed["ack_ts"])
+    elif image_urls or job.get("in_thread"):
+        ack_future = slack_pool.submit(post_and_record_ack)
+    
+    saved = journal.result(job["id"]) if resumed.get("state") == "model_done" else None
+    if saved:
+        try:
+            upload_result(client, job, *saved)
+        except Exception as e:
+            journal_record(job, "closed")
+            say(f"Error uploading image: {e}")
+        return
     
     # If no attached images, check thread for previous image
-    if not image_urls and event.get("thread_ts"):
-        thread_image = find_last_image_in_thread(client, channel_id, event["thread_ts"], bot_user_id)
+    follow_up = False
+    if not image_urls and job.get("in_thread"):
+        thread_image = find_last_image_in_thread(client, channel_id, thread_ts, dm=job["source"] == "dm")
         if thread_image:
             image_urls = [thread_image]
+            follow_up = True
     
     if not image_urls:
         # No image found anywhere - respond conversationally
         try:
-            response = chat_response(prompt if prompt else "hey")
-            say(f"🍌 {response}", thread_ts=thread_ts)
+            text = f"🍌 {chat_response(prompt if prompt else 'hey')}"
         except Exception as e:
-            say(f"🍌 To edit an image, mention me and attach the image you want to change!", thread_ts=thread_ts)
+            text = NO_IMAGE_HINTS[job["source"]]
+        ts = ack_future.result() if ack_future else None
+        if ts:
+            client.chat_update(channel=channel_id, ts=ts, text=text)
+        else:
+            say(text)
+        journal_record(job, "closed")
         return
     
-    say(f"🍌 {random.choice(ACKNOWLEDGMENTS)}", thread_ts=thread_ts)
+    # A follow-up that continues its thread's session doesn't need the image at all
+    history = session_history(job, image_urls[0]) if follow_up else None
+    
+    # Downloads start now; the acknowledgment may still be in flight
+    download_future = None if history else slack_pool.submit(download_slack_images, image_urls)
+    
+    # Keep the acknowledgment updated with stage, elapsed time and streamed text
+    progress = None
+    if STREAM_RESPONSES:
+        ts = ack_future.result()
+        if ts:
+            progress = ProgressMessage(
+                client, channel_id, ts, ack_text,
+                # Upload off this thread so the Gemini call's limiter slot and timing end with the stream
+                on_image=lambda data, mime_type, text: slack_pool.submit(upload_result, client, job, data, text, mime_type)
+            )
     
     try:
-        # Download all images
-        pil_images = [download_slack_image(url) for url in image_urls]
+        result, model_turn, images = None, None, []
+        if history:
+            result, model_turn = session_edit(job, history, progress)
+            if result is None:
+                download_future = slack_pool.submit(download_slack_images, image_urls)
         
-        result_image, result_text, mime_type = edit_image(pil_images, prompt, resolution, aspect_ratio)
+        if result is None:
+            if progress:
+                progress.stage("Downloading")
+            images = download_future.result()
         
-        if not result_image:
-            say(f"Gemini couldn't edit the image. {result_text or 'Try a different prompt.'}", thread_ts=thread_ts)
+        if job["flags"].get("batch") and len(images) > 1:
+            run_batch(client, job, images, progress)
+            return
+        if job["flags"].get("variants", 1) > 1:
+            run_variants(client, job, images, progress)
             return
         
-        # Use correct extension based on mime type
-        ext = "jpg" if mime_type == "image/jpeg" else "png"
+        if result is None:
+            result = prepare_and_edit(images, prompt, resolution, aspect_ratio, fresh=job["flags"].get("fresh", False), progress=progress)
+        result_image, result_text, mime_type = result
         
-        comment = f"🍌 *Edit{label_str}* by <@{user_id}>: _{prompt}_"
-        if result_text:
-            comment += f"\n\n{result_text}"
+        if not result_image:
+            if progress:
+                progress.finish("No image")
+            say(f"Gemini couldn't edit the image. {result_text or 'Try a different prompt.'}")
+            journal_record(job, "closed")
+            return
         
-        client.files_upload_v2(
-            channel=channel_id,
-            thread_ts=thread_ts,
-            content=result_image,
-            filename=f"banana-bot-edit.{ext}",
-            initial_comment=comment
-        )
+        # Streaming may already have uploaded it
+        if not (progress and progress.uploaded()):
+            if journal is not None and job.get("id"):
+                journal.record_result(job["id"], result_image, result_text, mime_type)
+            if progress:
+                progress.stage("Uploading")
+            upload_result(client, job, result_image, result_text, mime_type)
+        if progress:
+            progress.finish()
+        if follow_up and edit_sessions is not None:
+            slack_pool.submit(record_session_turn, job, images, result, model_turn)
         
     except Exception as e:
-        say(f"Error editing image: {e}", thread_ts=thread_ts)
+        if progress:
+            progress.finish("Failed")
+        say(f"Error editing image: {e}")
+        journal_record(job, "closed")
 
 
-@app.event("message")
-def handle_dm(event, client, say):
-    """Handle direct messages — no @mention needed."""
+def session_history(job: dict, image_url: str) -> list | None:
+    """The thread's session history, if a follow-up can continue it from `image_url`."""
+    if edit_sessions is None or job["flags"].get("batch") or job["flags"].get("variants", 1) > 1:
+        return None
+    history = edit_sessions.get(job["channel_id"], job["thread_ts"], image_url)
+    metrics.inc("banana_edit_session_turns_total", result="continued" if history else "new")
+    return history
+
+
+def session_edit(job: dict, history: list, progress=None) -> tuple[tuple[bytes | None, str | None, str | None] | None, types.Content | None]:
+    """Run a follow-up as the next turn of its thread's session. Returns (result, model_turn), or (None, None)
+    if Gemini won't take the history (say an uploaded file expired) and the session is dropped."""
+    contents = history + [types.Content(role="user", parts=[types.Part.from_text(text=job["prompt"])])]
+    if progress:
+        progress.stage("Waiting for Gemini")
+    try:
+        with metrics.timer("gemini", model=MODEL, resolution=job["resolution"]):
+            response = call_with_retry(
+                lambda timeout: gemini.models.generate_content(model=MODEL, contents=contents, config=edit_config(job["resolution"], job["aspect_ratio"], timeout)),
+                edit_limiter, deadline=EDIT_DEADLINE, max_attempts=GEMINI_MAX_ATTEMPTS
+            )
+    except ClientError as e:
+        if e.code == 429:
+            raise  # rate limited, not a problem with the history
+        print(f"Dropping edit session for {job['channel_id']}/{job['thread_ts']}: {e}")
+        metrics.inc("banana_edit_session_turns_total", result="rejected")
+        edit_sessions.drop(job["channel_id"], job["thread_ts"])
+        return None, None
+    
+    content = response.candidates[0].content if response.candidates else None
+    return edit_result(response), content
+
+
+def gemini_file(data: bytes, mime_type: str | None) -> types.Part:
+    """Upload bytes to Gemini's Files API, returning a part that refers to them."""
+    with metrics.timer("gemini_file_upload"):
+        uploaded = gemini.files.upload(file=io.BytesIO(data), config=types.UploadFileConfig(mime_type=mime_type or "image/png"))
+    metrics.inc("banana_bytes_total", len(data), kind="gemini_file")
+    return types.Part.from_uri(file_uri=uploaded.uri, mime_type=uploaded.mime_type)
+
+
+def record_session_turn(job: dict, inputs: list[tuple[bytes, str]], result: tuple[bytes | None, str | None, str | None], model_turn: types.Content | None):
+    """Add a finished follow-up to its thread's session, with its images uploaded to Gemini. Runs in the background.
+
+    Without a model_turn (the edit didn't go through a session) this starts a new session from it."""
+    try:
+        user = types.Content(role="user", parts=[types.Part.from_text(text=job["prompt"])] + [gemini_file(data, mime_type) for data, mime_type in inputs])
+        if model_turn is None:
+            image_data, text, mime_type = result
+            parts = ([types.Part.from_text(text=text)] if text else []) + [gemini_file(image_data, mime_type)]
+        else:
+            # Same parts (and thought signatures) Gemini sent, minus its thoughts, with the image as a file
+            parts = [
+                types.Part(file_data=gemini_file(p.inline_data.data, p.inline_data.mime_type).file_data, thought_signature=p.thought_signature) if p.inline_data else p
+                for p in model_turn.parts or [] if not p.thought
+            ]
+        model = types.Content(role="model", parts=parts)
+        
+        # The session carries on from whatever upload_result just made the thread's latest image
+        latest = thread_index.get(job["channel_id"], job["thread_ts"])
+        if latest is None:
+            return
+        if model_turn is None:
+            edit_sessions.start(job["channel_id"], job["thread_ts"], user, model, latest["url"])
+        else:
+            edit_sessions.extend(job["channel_id"], job["thread_ts"], user, model, latest["url"])
+    except Exception as e:
+        print(f"Error recording edit session: {e}")
+
+
+def run_batch(client, job: dict, images: list[tuple[bytes, str]], progress=None):
+    """Edit each image on its own, BATCH_CONCURRENCY at a time, uploading each result as soon as it's ready."""
+    start = time.time()
+    total = len(images)
+    done = set(job.get("journal", {}).get("batch_done", []))  # uploaded before a restart
+    failed = []
+    durations = []
+    
+    def edit_one(i: int) -> float:
+        started = time.time()
+        image_data, text, mime_type = prepare_and_edit([images[i]], job["prompt"], job["resolution"], job["aspect_ratio"], fresh=job["flags"].get("fresh", False))
+        if not image_data:
+            raise ValueError(text or "no image came back")
+        # No journal ID on the parts - the job is only finished once they all are
+        upload_result(client, dict(job, id=None, part=f"{i + 1}/{total}"), image_data, text, mime_type)
+        return time.time() - started
+    
+    with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, total), thread_name_prefix="banana-batch") as pool:
+        futures = {pool.submit(edit_one, i): i for i in range(total) if i not in done}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                durations.append(future.result())
+                done.add(i)
+                journal_record(job, "started", batch_done=sorted(done))
+            except Exception as e:
+                print(f"Batch image {i + 1}/{total} failed: {e}")
+                failed.append(i + 1)
+            if progress:
+                progress.stage(f"Edited {len(done)} of {total}")
+    
+    elapsed = time.time() - start
+    metrics.inc("banana_batch_images_total", len(durations), result="ok")
+    metrics.inc("banana_batch_images_total", len(failed), result="failed")
+    summary = f"🍌 *Batch done*: {len(done)} of {total} edited in {elapsed:.1f}s"
+    if durations:
+        summary += f" ({sum(durations) / len(durations):.1f}s per image, {min(BATCH_CONCURRENCY, total)} at a time)"
+    if failed:
+        summary += f"\nCouldn't edit image {', '.join(f'#{n}' for n in sorted(failed))} — try those again on their own."
+    if progress:
+        progress.finish()
+    client.chat_postMessage(channel=job["channel_id"], thread_ts=job["thread_ts"], text=summary)
+    journal_record(job, "uploaded")
+
+
+def run_variants(client, job: dict, images: list[tuple[bytes, str]], progress=None):
+    """Run the same edit several times at once over one download, and upload the takes together."""
+    count = job["flags"]["variants"]
+    # Every take wants its own Gemini call, so this skips the result cache and single-flight
+    if PREPROCESS_INPUTS:
+        if progress:
+            progress.stage("Preparing images")
+        images = preprocess_images(images, job["resolution"], job["aspect_ratio"])
+    if progress:
+        progress.stage(f"Generating {count} variants")
+    
+    def take() -> tuple[tuple[bytes | None, str | None, str | None], list | None]:
+        result = edit_image(images, job["prompt"], job["resolution"], job["aspect_ratio"])
+        if not result[0]:
+            return result, None
+        # Transcode while the other takes are still with Gemini
+        with metrics.timer("transcode", format=OUTPUT_FORMAT, resolution=job["resolution"]):
+            return result, transcode_pool.submit(encode_output, job, result[0], result[2]).result()
+    
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix="banana-variant") as pool:
+        futures = [pool.submit(take) for _ in range(count)]
+    results, errors = [], []
+    for future in futures:
+        try:
+            result, files = future.result()
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        if files:
+            results.append((result[1], files))
+        else:
+            errors.append(result[1])
+    
+    if not results:
+        if progress:
+            progress.finish("No image")
+        client.chat_postMessage(channel=job["channel_id"], thread_ts=job["thread_ts"],
+                                text=f"Gemini couldn't edit the image. {errors[0] or 'Try a different prompt.'}")
+        journal_record(job, "closed")
+        return
+    if errors:
+        print(f"{len(errors)} of {count} variants failed: {errors[0]}")
+    
+    if progress:
+        progress.stage("Uploading")
+    upload_encoded(client, job, next((text for text, _ in results if text), None), [files for _, files in results])
+    if progress:
+        progress.finish()
+
+
+def submit_edit_job(job: dict, client, say):
+    """Hand a job to the worker pool (or the worker processes), letting the user know if it has to wait."""
+    job["submitted_at"] = time.time()
+    note = degrade_job(job)
+    if journal is not None:
+        # On disk before a worker can start it (or Slack hears back), so a crash can't lose it
+        job["id"] = uuid.uuid4().hex
+        journal.record(job["id"], "accepted", wait=True, job=job)
+    tenant = {"user": job["user_id"], "channel": job["channel_id"], "cost": job_cost(job)}
+    try:
+        if job_queue is not None:
+            position = job_queue.put(job, **tenant)
+        else:
+            position = scheduler.submit(run_edit_job, job, client, **tenant)
+    except QueueFull:
+        metrics.inc("banana_jobs_rejected_total")
+        journal_record(job, "closed")
+        say("🍌 I'm swamped right now — give me a minute and try again.", thread_ts=job["thread_ts"])
+        return
+
+    if position > 0:
+        say(f"🍌 Queued, position {position} — I'll get to it shortly.{f' {note}' if note else ''}", thread_ts=job["thread_ts"])
+    elif note:
+        say(f"🍌 {note}", thread_ts=job["thread_ts"])
+
+
+def is_dm_event(event) -> bool:
+    """True for a person's message (or file share) in a DM with the bot."""
     # Ignore bot messages to prevent loops
     if event.get("bot_id"):
-        return
+        return False
     
     # Ignore message subtypes except file_share (which is how images come through)
     subtype = event.get("subtype")
     if subtype and subtype != "file_share":
-        return
+        return False
     
     # Only handle DMs (channel type "im")
-    channel_type = event.get("channel_type")
-    if channel_type != "im":
+    return event.get("channel_type") == "im"
+
+
+def small_talk_reply(event, prompt: str) -> str | None:
+    """Template reply for small talk with nothing to edit, so it's answered here instead of queueing a job."""
+    # With an attachment there's an image to edit, and in a thread there may be one earlier on
+    if image_urls_from_files(event.get("files", [])) or event.get("thread_ts"):
+        return None
+    reply = local_reply(prompt)
+    if reply:
+        metrics.inc("banana_chat_replies_total", source="local")
+    return reply
+
+
+def job_from_event(event, source: str, text: str) -> dict:
+    """Build an edit job from a mention or DM and its prompt text."""
+    # Parse resolution and aspect ratio from prompt
+    prompt, resolution, aspect_ratio, flags = parse_options(text)
+    
+    return {
+        "source": source,
+        "user_id": event["user"],
+        "channel_id": event["channel"],
+        "thread_ts": event.get("thread_ts") or event.get("ts"),
+        "in_thread": bool(event.get("thread_ts")),
+        "prompt": prompt,
+        "resolution": resolution,
+        "aspect_ratio": aspect_ratio,
+        "flags": flags,
+        "image_urls": image_urls_from_files(event.get("files", [])),
+    }
+
+
+@app.event("app_mention")
+def handle_mention(event, client, say, body):
+    """Handle @mentions - IMAGE EDITING."""
+    # Slack retries events it thinks we missed - only handle each one once
+    if is_duplicate_event(event, body):
         return
     
-    user_id = event["user"]
-    channel_id = event["channel"]
-    thread_ts = event.get("thread_ts") or event.get("ts")
-    text = event.get("text", "").strip()
-    files = event.get("files", [])
+    thread_ts = event.get("thread_ts") or event.get("ts")  # Reply in thread or start new one
+    text = event.get("text", "")
     
-    if not text:
-        say("🍌 Hey! Send me an image with a prompt and I'll edit it for you.", thread_ts=thread_ts)
+    remember_event_images(event)
+    
+    # Remove the bot mention from the text to get the prompt
+    prompt = re.sub(r"<@[A-Z0-9]+>", "", text).strip()
+    
+    if not prompt:
+        # Empty mention - respond briefly
+        say(f"🍌 {local_reply('')}", thread_ts=thread_ts)
         return
     
-    # Parse resolution and aspect ratio from prompt
-    prompt, resolution, aspect_ratio = parse_options(text)
+    reply = small_talk_reply(event, prompt)
+    if reply:
+        say(f"🍌 {reply}", thread_ts=thread_ts)
+        return
     
-    # Build label for output
-    labels = []
-    if resolution == "4K":
-        labels.append("4K")
-    if aspect_ratio:
-        labels.append(aspect_ratio)
-    label_str = f" ({', '.join(labels)})" if labels else ""
+    submit_edit_job(job_from_event(event, "mention", prompt), client, say)
+
+
+@app.event("message")
+def handle_dm(event, client, say, body):
+    """Handle direct messages — no @mention needed."""
+    if not is_dm_event(event):
+        return
     
-    # Collect ALL images from attached files
-    image_urls = []
-    for f in files:
-        if f.get("mimetype", "").startswith("image/"):
-            image_urls.append(f.get("url_private"))
+    # Slack retries events it thinks we missed - only handle each one once
+    if is_duplicate_event(event, body):
+        return
     
-    # If no attached images, check thread for previous image
-    if not image_urls and event.get("thread_ts"):
-        bot_user_id = client.auth_test()["user_id"]
-        thread_image = find_last_image_in_thread(client, channel_id, event["thread_ts"], bot_user_id)
-        if thread_image:
-            image_urls = [thread_image]
+    remember_event_images(event)
     
-    if not image_urls:
-        # No image found — respond conversationally
-        try:
-            response = chat_response(prompt if prompt else "hey")
-            say(f"🍌 {response}", thread_ts=thread_ts)
-        except Exception as e:
-            say(f"🍌 To edit an image, send it along with your prompt!", thread_ts=thread_ts)
+    thread_ts = event.get("thread_ts") or event.get("ts")
+    text = event.get("text", "").strip()
+    
+    if not text:
+        say("🍌 Hey! Send me an image with a prompt and I'll edit it for you.", thread_ts=thread_ts)
         return
     
-    say(f"🍌 {random.choice(ACKNOWLEDGMENTS)}", thread_ts=thread_ts)
+    reply = small_talk_reply(event, text)
+    if reply:
+        say(f"🍌 {reply}", thread_ts=thread_ts)
+        return
     
-    try:
-        # Download all images
-        pil_images = [download_slack_image(url) for url in image_urls]
-        
-        result_image, result_text, mime_type = edit_image(pil_images, prompt, resolution, aspect_ratio)
-        
-        if not result_image:
-            say(f"Gemini couldn't edit the image. {result_text or 'Try a different prompt.'}", thread_ts=thread_ts)
-            return
-        
-        # Use correct extension based on mime type
-        ext = "jpg" if mime_type == "image/jpeg" else "png"
-        
-        comment = f"🍌 *Edit{label_str}*: _{prompt}_"
-        if result_text:
-            comment += f"\n\n{result_text}"
-        
-        client.files_upload_v2(
-            channel=channel_id,
-            thread_ts=thread_ts,
-            content=result_image,
-            filename=f"banana-bot-edit.{ext}",
-            initial_comment=comment
-        )
-        
-    except Exception as e:
-        say(f"Error editing image: {e}", thread_ts=thread_ts)
+    submit_edit_job(job_from_event(event, "dm", text), client, say)
 
 
 if __name__ == "__main__":
@@ -495,5 +1449,18 @@ if __name__ == "__main__":
     print("   • Reply in thread to iterate on previous edits")
     print("   • DMs supported — no @mention needed")
     print("   • Search grounding enabled for real-time data")
+    print(f"   • {EDIT_WORKERS} edit workers, up to {EDIT_QUEUE_SIZE} queued")
+    
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+        print(f"   • Metrics on http://127.0.0.1:{METRICS_PORT}/metrics")
+    
+    # Resolve our identity up front so no handler has to call auth.test
+    identity = bot_identity.resolve(app.client)
+    print(f"   • Connected as <@{identity['user_id']}> in {identity['team'] or identity['team_id']}")
+    
+    # Pick up edits a crash or restart interrupted, alongside new ones
+    threading.Thread(target=resume_jobs, args=(app.client,), name="banana-resume", daemon=True).start()
+    
     handler = SocketModeHandler(app, SLACK_APP_TOKEN)
     handler.start()
@@ -0,0 +1,578 @@
+"""Banana Bot on asyncio: `python async_app.py` instead of `python app.py`.
+
+Same behavior and settings as app.py, but handlers, Slack calls, downloads and
+Gemini calls are coroutines on one event loop, so a waiting edit costs a task
+rather than a thread. CPU work (decoding, resizing, transcoding) still runs on
+threads. Caches, indexes, dedup and metrics are app.py's own.
+"""
+import re
+import time
+import uuid
+import random
+import asyncio
+import httpx
+from google import genai
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from google.genai import types
+from google.genai.errors import ClientError
+
+import app as bot
+from downloader import AsyncDownloader
+from gemini_control import AsyncAdaptiveLimiter, async_call_with_retry
+from jobs import AsyncJobScheduler, QueueFull
+from progress import AsyncProgressMessage
+from singleflight import AsyncSingleFlight
+
+app = AsyncApp(token=bot.SLACK_BOT_TOKEN)
+app.client.base_url = bot.SLACK_API_URL
+
+# A streamed image arrives as one server-sent event line, and google-genai's aiohttp
+# transport won't read a line over 4MB - its httpx transport has no such limit
+stream_gemini = genai.Client(api_key=bot.GEMINI_API_KEY, http_options=types.HttpOptions(async_client_args={"transport": httpx.AsyncHTTPTransport()}))
+
+edit_limiter = AsyncAdaptiveLimiter(bot.MODEL, initial=min(4, bot.GEMINI_MAX_CONCURRENCY), max_limit=bot.GEMINI_MAX_CONCURRENCY, latency_tolerance=3.0)
+chat_limiter = AsyncAdaptiveLimiter(bot.CHAT_MODEL, initial=min(4, bot.GEMINI_MAX_CONCURRENCY), max_limit=bot.GEMINI_MAX_CONCURRENCY * 2)
+light_chat_limiter = AsyncAdaptiveLimiter(bot.LIGHT_CHAT_MODEL, initial=min(4, bot.GEMINI_MAX_CONCURRENCY), max_limit=bot.GEMINI_MAX_CONCURRENCY * 2)
+
+# Edits run as tasks, shared fairly between users and channels like app.py's worker pool
+scheduler = AsyncJobScheduler(
+    workers=bot.ASYNC_EDITS,
+    max_queue=bot.EDIT_QUEUE_SIZE,
+    name="banana-async",
+    weights=bot.parse_weights(bot.TENANT_WEIGHTS),
+    user_rate=bot.USER_RATE_PER_MIN / 60,
+    user_burst=bot.USER_BURST,
+    channel_rate=bot.CHANNEL_RATE_PER_MIN / 60,
+    channel_burst=bot.CHANNEL_BURST,
+)
+
+downloader = AsyncDownloader(max_bytes=bot.DOWNLOAD_MAX_MB * 1024 * 1024, timeout=bot.DOWNLOAD_TIMEOUT)
+
+inflight_edits = AsyncSingleFlight()
+
+# Point app.py's load policy and gauges at the async scheduler and limiters
+bot.load_policy.depth = scheduler.depth
+bot.load_policy.latency = lambda: edit_limiter.avg_latency if edit_limiter.in_flight else None
+bot.metrics.gauge("banana_queue_depth", scheduler.depth)
+bot.metrics.gauge("banana_workers_busy", scheduler.busy)
+bot.tenant_gauges(scheduler)
+bot.metrics.gauge("banana_gemini_concurrency_limit", lambda: int(edit_limiter.limit), model=bot.MODEL)
+bot.metrics.gauge("banana_gemini_concurrency_limit", lambda: int(chat_limiter.limit), model=bot.CHAT_MODEL)
+bot.metrics.gauge("banana_gemini_in_flight", lambda: edit_limiter.in_flight, model=bot.MODEL)
+bot.metrics.gauge("banana_gemini_in_flight", lambda: chat_limiter.in_flight, model=bot.CHAT_MODEL)
+bot.metrics.gauge("banana_gemini_concurrency_limit", lambda: int(light_chat_limiter.limit), model=bot.LIGHT_CHAT_MODEL)
+bot.metrics.gauge("banana_gemini_in_flight", lambda: light_chat_limiter.in_flight, model=bot.LIGHT_CHAT_MODEL)
+
+
+async def chat_response(message: str) -> str:
+    reply = bot.quick_chat_reply(message)
+    if reply:
+        return reply
+
+    model, limiter = bot.CHAT_MODEL, chat_limiter
+    reason = bot.load_policy.pressure()
+    if reason:
+        model, limiter = bot.LIGHT_CHAT_MODEL, light_chat_limiter
+        bot.metrics.inc("banana_degraded_total", kind="chat_model", reason=reason)
+
+    with bot.metrics.timer("gemini", model=model):
+        response = await async_call_with_retry(
+            lambda timeout: bot.gemini.aio.models.generate_content(model=model, contents=[message], config=bot.chat_config(timeout)),
+            limiter, deadline=bot.CHAT_DEADLINE, max_attempts=bot.GEMINI_MAX_ATTEMPTS
+        )
+    text = bot.chat_reply_text(message, response)
+    return f"{text}\n{bot.DEGRADED_NOTES['chat_model']}" if reason else text
+
+
+async def edit_image(images: list[tuple[bytes, str]], prompt: str, resolution: str = "2K", aspect_ratio: str | None = None, progress=None) -> tuple[bytes | None, str | None, str | None]:
+    contents = bot.edit_contents(images, prompt)
+
+    with bot.metrics.timer("gemini", model=bot.MODEL, resolution=resolution):
+        if progress and bot.STREAM_RESPONSES:
+            return await async_call_with_retry(
+                lambda timeout: stream_edit(contents, bot.edit_config(resolution, aspect_ratio, timeout), progress),
+                edit_limiter, deadline=bot.EDIT_DEADLINE, max_attempts=bot.GEMINI_MAX_ATTEMPTS
+            )
+
+        response = await async_call_with_retry(
+            lambda timeout: bot.gemini.aio.models.generate_content(model=bot.MODEL, contents=contents, config=bot.edit_config(resolution, aspect_ratio, timeout)),
+            edit_limiter, deadline=bot.EDIT_DEADLINE, max_attempts=bot.GEMINI_MAX_ATTEMPTS
+        )
+
+    return bot.edit_result(response)
+
+
+async def session_edit(job: dict, history: list, progress=None) -> tuple[tuple[bytes | None, str | None, str | None] | None, types.Content | None]:
+    contents = history + [types.Content(role="user", parts=[types.Part.from_text(text=job["prompt"])])]
+    if progress:
+        await progress.stage("Waiting for Gemini")
+    try:
+        with bot.metrics.timer("gemini", model=bot.MODEL, resolution=job["resolution"]):
+            response = await async_call_with_retry(
+                lambda timeout: bot.gemini.aio.models.generate_content(model=bot.MODEL, contents=contents, config=bot.edit_config(job["resolution"], job["aspect_ratio"], timeout)),
+                edit_limiter, deadline=bot.EDIT_DEADLINE, max_attempts=bot.GEMINI_MAX_ATTEMPTS
+            )
+    except ClientError as e:
+        if e.code == 429:
+            raise  # rate limited, not a problem with the history
+        print(f"Dropping edit session for {job['channel_id']}/{job['thread_ts']}: {e}")
+        bot.metrics.inc("banana_edit_session_turns_total", result="rejected")
+        bot.edit_sessions.drop(job["channel_id"], job["thread_ts"])
+        return None, None
+
+    content = response.candidates[0].content if response.candidates else None
+    return bot.edit_result(response), content
+
+
+async def stream_edit(contents: list, config, progress) -> tuple[bytes | None, str | None, str | None]:
+    text_response = None
+    image_data = None
+    mime_type = None
+
+    progress.restart()
+    await progress.stage("Waiting for Gemini")
+    try:
+        async for chunk in await stream_gemini.aio.models.generate_content_stream(model=bot.MODEL, contents=contents, config=config):
+            await progress.stage("Generating")
+            for part in chunk.parts or []:
+                if part.text:
+                    text_response = (text_response or "") + part.text
+                    await progress.text(part.text)
+                elif part.inline_data:
+                    image_data = part.inline_data.data
+                    mime_type = part.inline_data.mime_type
+                    await progress.image(image_data, mime_type, text_response)
+    except Exception:
+        if image_data is None:
+            raise
+
+    return image_data, text_response, mime_type
+
+
+async def download_slack_images(urls: list[str]) -> list[tuple[bytes, str]]:
+    # The image cache may read and write disk, so it stays off the loop
+    keys, blobs, missing = await asyncio.to_thread(bot.cached_images, urls)
+
+    if missing:
+        with bot.metrics.timer("download", files=len(missing)):
+            fetched = await downloader.fetch_all([urls[i] for i in missing], headers=bot.SLACK_AUTH_HEADERS)
+        await asyncio.to_thread(bot.store_downloads, keys, blobs, missing, fetched)
+
+    return await asyncio.to_thread(lambda: [bot.as_gemini_image(data) for data in blobs])
+
+
+async def find_last_image_in_thread(client, channel_id: str, thread_ts: str, dm: bool = False) -> str | None:
+    entry = bot.thread_index.get(channel_id, thread_ts)
+    if entry and bot.index_trusted(entry, dm):
+        bot.metrics.inc("banana_thread_index_total", result="hit")
+        return entry["url"]
+
+    # An older index entry is checked from its image on, for images posted without a mention
+    try:
+        latest = entry
+        cursor = None
+        with bot.metrics.timer("thread_check" if entry else "thread_lookup"):
+            while True:
+                result = await client.conversations_replies(channel=channel_id, ts=thread_ts, oldest=entry and entry["ts"], limit=200, cursor=cursor)
+                latest = bot.newest_image(result.get("messages", []), latest)
+                cursor = (result.get("response_metadata") or {}).get("next_cursor")
+                if not cursor:
+                    break
+    except Exception as e:
+        print(f"Error fetching thread: {e}")
+        latest = entry
+
+    bot.metrics.inc("banana_thread_index_total", result="miss" if not entry else "checked" if latest is entry else "stale")
+    if latest is None:
+        return None
+    bot.thread_index.record(channel_id, thread_ts, latest["url"], latest["ts"])
+    return latest["url"]
+
+
+async def prepare_and_edit(images: list[tuple[bytes, str]], prompt: str, resolution: str, aspect_ratio: str | None, fresh: bool = False, progress=None) -> tuple[bytes | None, str | None, str | None]:
+    key = bot.result_key(images, prompt, resolution, aspect_ratio)
+    if bot.result_cache and not fresh:
+        cached = bot.result_cache.get(key)
+        bot.metrics.inc("banana_result_cache_total", result="hit" if cached else "miss")
+        if cached:
+            return cached
+
+    result, shared = await inflight_edits.do(key, _preprocess_and_edit, images, prompt, resolution, aspect_ratio, progress)
+    if shared:
+        bot.metrics.inc("banana_edits_coalesced_total")
+    elif bot.result_cache and result[0]:
+        bot.result_cache.put(key, result)
+    return result
+
+
+async def _preprocess_and_edit(images: list[tuple[bytes, str]], prompt: str, resolution: str, aspect_ratio: str | None, progress=None) -> tuple[bytes | None, str | None, str | None]:
+    if bot.PREPROCESS_INPUTS:
+        if progress:
+            await progress.stage("Preparing images")
+        images = await asyncio.to_thread(bot.preprocess_images, images, resolution, aspect_ratio)
+
+    return await edit_image(images, prompt, resolution, aspect_ratio, progress)
+
+
+async def upload_result(client, job: dict, image_data: bytes, text: str | None, mime_type: str | None):
+    await upload_gallery(client, job, [(image_data, text, mime_type)])
+
+
+async def upload_gallery(client, job: dict, results: list[tuple[bytes, str | None, str | None]]):
+    loop = asyncio.get_running_loop()
+    with bot.metrics.timer("transcode", format=bot.OUTPUT_FORMAT, resolution=job["resolution"]):
+        groups = await asyncio.gather(*(loop.run_in_executor(bot.transcode_pool, bot.encode_output, job, data, mime_type) for data, _, mime_type in results))
+    await upload_encoded(client, job, next((text for _, text, _ in results if text), None), groups)
+
+
+async def upload_encoded(client, job: dict, text: str | None, groups: list[list[tuple[bytes, str | None]]]):
+    if len(groups) > 1:
+        job = dict(job, part=f"{len(groups)} variants")
+    comment = bot.upload_comment(job, text)
+    files = [f for group in groups for f in group]
+
+    with bot.metrics.timer("upload", resolution=job["resolution"]):
+        upload = await client.files_upload_v2(
+            channel=job["channel_id"],
+            thread_ts=job["thread_ts"],
+            file_uploads=bot.gallery_uploads(groups),
+            initial_comment=comment
+        )
+    bot.journal_record(job, "uploaded")
+    bot.metrics.inc("banana_bytes_total", sum(len(data) for data, _ in files), kind="upload")
+    await asyncio.to_thread(bot.remember_upload, upload, [data for data, _ in files], job["channel_id"], job["thread_ts"])
+
+
+async def run_edit_job(job: dict, client):
+    if job.get("submitted_at"):
+        bot.metrics.observe("banana_queue_wait_seconds", time.time() - job["submitted_at"], resolution=job["resolution"])
+    with bot.metrics.timer("total", resolution=job["resolution"], source=job["source"]):
+        await _run_edit_job(job, client)
+
+
+async def _run_edit_job(job: dict, client):
+    channel_id = job["channel_id"]
+    thread_ts = job["thread_ts"]
+    prompt = job["prompt"]
+    image_urls = job["image_urls"]
+
+    async def say(text: str):
+        return await client.chat_postMessage(channel=channel_id, thread_ts=thread_ts, text=text)
+
+    # Same graph as app.py: the acknowledgment goes out while we find and fetch the images
+    ack_text = f"🍌 {random.choice(bot.ACKNOWLEDGMENTS)}"
+
+    async def post_ack() -> str | None:
+        try:
+            return (await say(ack_text))["ts"]
+        except Exception as e:
+            print(f"Error posting acknowledgment: {e}")
+            return None
+
+    async def post_and_record_ack() -> str | None:
+        ts = await post_ack()
+        if ts:
+            bot.journal_record(job, "started", ack_ts=ts)
+        return ts
+
+    resumed = job.get("journal", {})
+    bot.journal_record(job, "started")
+
+    ack_task = None
+    if resumed.get("ack_ts"):
+        ack_task = asyncio.get_running_loop().create_future()
+        ack_task.set_result(resumed["ack_ts"])
+    elif image_urls or job.get("in_thread"):
+        ack_task = asyncio.create_task(post_and_record_ack())
+
+    saved = await asyncio.to_thread(bot.journal.result, job["id"]) if resumed.get("state") == "model_done" else None
+    if saved:
+        try:
+            await upload_result(client, job, *saved)
+        except Exception as e:
+            bot.journal_record(job, "closed")
+            await say(f"Error uploading image: {e}")
+        return
+
+    follow_up = False
+    if not image_urls and job.get("in_thread"):
+        thread_image = await find_last_image_in_thread(client, channel_id, thread_ts, dm=job["source"] == "dm")
+        if thread_image:
+            image_urls = [thread_image]
+            follow_up = True
+
+    if not image_urls:
+        try:
+            text = f"🍌 {await chat_response(prompt if prompt else 'hey')}"
+        except Exception as e:
+            text = bot.NO_IMAGE_HINTS[job["source"]]
+        ts = await ack_task if ack_task else None
+        if ts:
+            await client.chat_update(channel=channel_id, ts=ts, text=text)
+        else:
+            await say(text)
+        bot.journal_record(job, "closed")
+        return
+
+    history = bot.session_history(job, image_urls[0]) if follow_up else None
+    download_task = None if history else asyncio.create_task(download_slack_images(image_urls))
+
+    progress = None
+    if bot.STREAM_RESPONSES:
+        ts = await ack_task
+        if ts:
+            progress = AsyncProgressMessage(
+                client, channel_id, ts, ack_text,
+                on_image=lambda data, mime_type, text: asyncio.create_task(upload_result(client, job, data, text, mime_type))
+            )
+
+    try:
+        result, model_turn, images = None, None, []
+        if history:
+            result, model_turn = await session_edit(job, history, progress)
+            if result is None:
+                download_task = asyncio.create_task(download_slack_images(image_urls))
+
+        if result is None:
+            if progress:
+                await progress.stage("Downloading")
+            images = await download_task
+
+        if job["flags"].get("batch") and len(images) > 1:
+            await run_batch(client, job, images, progress)
+            return
+        if job["flags"].get("variants", 1) > 1:
+            await run_variants(client, job, images, progress)
+            return
+
+        if result is None:
+            result = await prepare_and_edit(images, prompt, job["resolution"], job["aspect_ratio"], fresh=job["flags"].get("fresh", False), progress=progress)
+        result_image, result_text, mime_type = result
+
+        if not result_image:
+            if progress:
+                await progress.finish("No image")
+            await say(f"Gemini couldn't edit the image. {result_text or 'Try a different prompt.'}")
+            bot.journal_record(job, "closed")
+            return
+
+        if not (progress and await progress.uploaded()):
+            if bot.journal is not None and job.get("id"):
+                bot.journal.record_result(job["id"], result_image, result_text, mime_type)
+            if progress:
+                await progress.stage("Uploading")
+            await upload_result(client, job, result_image, result_text, mime_type)
+        if progress:
+            await progress.finish()
+        if follow_up and bot.edit_sessions is not None:
+            bot.slack_pool.submit(bot.record_session_turn, job, images, result, model_turn)
+
+    except Exception as e:
+        if progress:
+            await progress.finish("Failed")
+        await say(f"Error editing image: {e}")
+        bot.journal_record(job, "closed")
+    finally:
+        if ack_task:
+            await ack_task
+
+
+async def run_batch(client, job: dict, images: list[tuple[bytes, str]], progress=None):
+    start = time.time()
+    total = len(images)
+    done = set(job.get("journal", {}).get("batch_done", []))
+    durations = []
+    slots = asyncio.Semaphore(bot.BATCH_CONCURRENCY)
+
+    async def edit_one(i: int) -> tuple[int, float]:
+        async with slots:
+            started = time.time()
+            image_data, text, mime_type = await prepare_and_edit([images[i]], job["prompt"], job["resolution"], job["aspect_ratio"], fresh=job["flags"].get("fresh", False))
+            if not image_data:
+                raise ValueError(text or "no image came back")
+            await upload_result(client, dict(job, id=None, part=f"{i + 1}/{total}"), image_data, text, mime_type)
+            return i, time.time() - started
+
+    tasks = {asyncio.create_task(edit_one(i)): i for i in range(total) if i not in done}
+    for task in asyncio.as_completed(list(tasks)):
+        try:
+            i, duration = await task
+            durations.append(duration)
+            done.add(i)
+            bot.journal_record(job, "started", batch_done=sorted(done))
+        except Exception as e:
+            print(f"Batch image failed: {e}")
+        if progress:
+            await progress.stage(f"Edited {len(done)} of {total}")
+    failed = [i + 1 for i in range(total) if i not in done]
+
+    elapsed = time.time() - start
+    bot.metrics.inc("banana_batch_images_total", len(durations), result="ok")
+    bot.metrics.inc("banana_batch_images_total", len(failed), result="failed")
+    summary = f"🍌 *Batch done*: {len(done)} of {total} edited in {elapsed:.1f}s"
+    if durations:
+        summary += f" ({sum(durations) / len(durations):.1f}s per image, {min(bot.BATCH_CONCURRENCY, total)} at a time)"
+    if failed:
+        summary += f"\nCouldn't edit image {', '.join(f'#{n}' for n in failed)} — try those again on their own."
+    if progress:
+        await progress.finish()
+    await client.chat_postMessage(channel=job["channel_id"], thread_ts=job["thread_ts"], text=summary)
+    bot.journal_record(job, "uploaded")
+
+
+async def run_variants(client, job: dict, images: list[tuple[bytes, str]], progress=None):
+    count = job["flags"]["variants"]
+    if bot.PREPROCESS_INPUTS:
+        if progress:
+            await progress.stage("Preparing images")
+        images = await asyncio.to_thread(bot.preprocess_images, images, job["resolution"], job["aspect_ratio"])
+    if progress:
+        await progress.stage(f"Generating {count} variants")
+
+    async def take() -> tuple[tuple[bytes | None, str | None, str | None], list | None]:
+        result = await edit_image(images, job["prompt"], job["resolution"], job["aspect_ratio"])
+        if not result[0]:
+            return result, None
+        with bot.metrics.timer("transcode", format=bot.OUTPUT_FORMAT, resolution=job["resolution"]):
+            return result, await asyncio.get_running_loop().run_in_executor(bot.transcode_pool, bot.encode_output, job, result[0], result[2])
+
+    results, errors = [], []
+    for outcome in await asyncio.gather(*(take() for _ in range(count)), return_exceptions=True):
+        if isinstance(outcome, Exception):
+            errors.append(str(outcome))
+        elif outcome[1]:
+            results.append((outcome[0][1], outcome[1]))
+        else:
+            errors.append(outcome[0][1])
+
+    if not results:
+        if progress:
+            await progress.finish("No image")
+        await client.chat_postMessage(channel=job["channel_id"], thread_ts=job["thread_ts"],
+                                      text=f"Gemini couldn't edit the image. {errors[0] or 'Try a different prompt.'}")
+        bot.journal_record(job, "closed")
+        return
+    if errors:
+        print(f"{len(errors)} of {count} variants failed: {errors[0]}")
+
+    if progress:
+        await progress.stage("Uploading")
+    await upload_encoded(client, job, next((text for text, _ in results if text), None), [files for _, files in results])
+    if progress:
+        await progress.finish()
+
+
+async def submit_edit_job(job: dict, client, say):
+    job["submitted_at"] = time.time()
+    note = bot.degrade_job(job)
+    if bot.journal is not None:
+        job["id"] = uuid.uuid4().hex
+        await asyncio.to_thread(bot.journal.record, job["id"], "accepted", wait=True, job=job)
+    try:
+        position = scheduler.submit(
+            run_edit_job, job, client,
+            user=job["user_id"],
+            channel=job["channel_id"],
+            cost=bot.job_cost(job),
+        )
+    except QueueFull:
+        bot.metrics.inc("banana_jobs_rejected_total")
+        bot.journal_record(job, "closed")
+        await say("🍌 I'm swamped right now — give me a minute and try again.", thread_ts=job["thread_ts"])
+        return
+
+    if position > 0:
+        await say(f"🍌 Queued, position {position} — I'll get to it shortly.{f' {note}' if note else ''}", thread_ts=job["thread_ts"])
+    elif note:
+        await say(f"🍌 {note}", thread_ts=job["thread_ts"])
+
+
+@app.event("app_mention")
+async def handle_mention(event, client, say, body):
+    if bot.is_duplicate_event(event, body):
+        return
+
+    thread_ts = event.get("thread_ts") or event.get("ts")
+    bot.remember_event_images(event)
+
+    prompt = re.sub(r"<@[A-Z0-9]+>", "", event.get("text", "")).strip()
+    if not prompt:
+        await say(f"🍌 {bot.local_reply('')}", thread_ts=thread_ts)
+        return
+
+    reply = bot.small_talk_reply(event, prompt)
+    if reply:
+        await say(f"🍌 {reply}", thread_ts=thread_ts)
+        return
+
+    await submit_edit_job(bot.job_from_event(event, "mention", prompt), client, say)
+
+
+@app.event("message")
+async def handle_dm(event, client, say, body):
+    if not bot.is_dm_event(event):
+        return
+    if bot.is_duplicate_event(event, body):
+        return
+
+    bot.remember_event_images(event)
+
+    thread_ts = event.get("thread_ts") or event.get("ts")
+    text = event.get("text", "").strip()
+    if not text:
+        await say("🍌 Hey! Send me an image with a prompt and I'll edit it for you.", thread_ts=thread_ts)
+        return
+
+    reply = bot.small_talk_reply(event, text)
+    if reply:
+        await say(f"🍌 {reply}", thread_ts=thread_ts)
+        return
+
+    await submit_edit_job(bot.job_from_event(event, "dm", text), client, say)
+
+
+async def resume_jobs(client):
+    """Resubmit the edits the journal says were interrupted, waiting for room in the queue."""
+    jobs = bot.journal.unfinished() if bot.journal is not None else []
+    if jobs:
+        print(f"Resuming {len(jobs)} interrupted edits")
+    for job in jobs:
+        give_up = await asyncio.to_thread(bot.resume_or_give_up, job)
+        if give_up:
+            try:
+                await client.chat_postMessage(channel=job["channel_id"], thread_ts=job["thread_ts"], text=give_up)
+            except Exception as e:
+                print(f"Error posting to {job['channel_id']}: {e}")
+            continue
+        job["submitted_at"] = time.time()
+        while True:
+            try:
+                scheduler.submit(run_edit_job, job, client, user=job["user_id"], channel=job["channel_id"], cost=bot.job_cost(job))
+                break
+            except QueueFull:
+                await asyncio.sleep(1)
+
+
+async def main():
+    print("⚡ Banana Bot is running on asyncio!")
+    print(f"   • Up to {bot.ASYNC_EDITS} edits at once, up to {bot.EDIT_QUEUE_SIZE} queued")
+
+    if bot.METRICS_PORT:
+        bot.metrics.serve(bot.METRICS_PORT)
+        print(f"   • Metrics on http://127.0.0.1:{bot.METRICS_PORT}/metrics")
+
+    identity = bot.bot_identity.resolve(bot.app.client)
+    print(f"   • Connected as <@{identity['user_id']}> in {identity['team'] or identity['team_id']}")
+
+    scheduler.start()
+    handler = AsyncSocketModeHandler(app, bot.SLACK_APP_TOKEN)
+    try:
+        # gather holds on to the resume task; the loop alone only keeps a weak reference
+        await asyncio.gather(resume_jobs(app.client), handler.start_async())
+    finally:
+        await downloader.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
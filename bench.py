@@ -0,0 +1,395 @@
+"""Offline load test for Banana Bot, with local stand-ins for Slack and Gemini.
+
+A child process serves a fake Slack Web API (chat, conversations, file
+downloads and uploads) and a fake Gemini endpoint with configurable latency,
+error rate and image sizes. This process imports app.py (or async_app.py)
+pointed at those stand-ins and feeds events through Bolt the same way Socket
+Mode does, at a target rate, then reports end-to-end latency, throughput and
+peak RSS of the bot process (and with --cluster, of the largest worker).
+
+    python bench.py --events 100 --rate 5
+    python bench.py --events 50 --rate 10 --gemini-latency 20 --dm-ratio 0.5 --save-events traffic.jsonl
+    python bench.py --replay traffic.jsonl
+
+Replay files have one JSON object per line: {"offset": seconds, "body": <Events API envelope>}.
+Any bot setting (BANANA_EDIT_WORKERS etc.) can be set in the environment as usual.
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import tempfile
+import resource
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Event, Process, Queue
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image
+
+
+def make_png(size: int, seed: int) -> bytes:
+    """A noisy RGB PNG, so it compresses about as badly as a real photo."""
+    random.seed(seed)
+    channels = [Image.effect_noise((size, size), 40 + random.random() * 40) for _ in range(3)]
+    out = io.BytesIO()
+    Image.merge("RGB", channels).save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+
+# Fake Slack + Gemini, run in a child process so they don't count towards the bot's memory
+
+def run_stubs(config: dict, port_queue: Queue, completions: Queue):
+    input_image = make_png(config["input_px"], 1)
+    output_b64 = base64.b64encode(make_png(config["output_px"], 2)).decode()
+    counter = iter(range(1, 10**9))
+    lock = threading.Lock()
+
+    def next_id() -> int:
+        with lock:
+            return next(counter)
+
+    def gemini_latency() -> float:
+        return max(0.0, random.gauss(config["gemini_latency"], config["gemini_jitter"]))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _params(self) -> dict:
+            parsed = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            content_type = self.headers.get("Content-Type", "")
+            if not parsed.path.startswith(("/api/", "/v1beta/")):
+                pass  # file uploads are raw bytes
+            elif body and "json" in content_type:
+                params.update(json.loads(body))
+            elif body and "form" in content_type:
+                params.update({k: v[0] for k, v in parse_qs(body.decode()).items()})
+            params["_body"] = body
+            return params
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, data: dict, status: int = 200):
+            self._send(status, json.dumps(data).encode())
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path.startswith("/files-pri/"):
+                time.sleep(config["download_latency"])
+                self._send(200, input_image, "image/png")
+            elif path.startswith("/api/"):
+                self._slack(path[len("/api/"):], self._params())
+            else:
+                self._send(404, b"{}")
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            params = self._params()
+            if path.startswith("/api/"):
+                self._slack(path[len("/api/"):], params)
+            elif path.startswith("/upload/"):
+                time.sleep(config["slack_latency"] + len(params["_body"]) / config["upload_bytes_per_sec"])
+                self._send(200, f"OK - {len(params['_body'])}".encode(), "text/plain")
+            elif ":generateContent" in path or ":streamGenerateContent" in path:
+                self._gemini(path, params)
+            else:
+                self._send(404, b"{}")
+
+        def _slack(self, method: str, params: dict):
+            time.sleep(config["slack_latency"])
+            port = self.server.server_address[1]
+            if method == "auth.test":
+                self._json({"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "TBENCH", "team": "bench", "user": "banana_bot"})
+            elif method == "chat.postMessage":
+                text = params.get("text", "")
+                if text.startswith(("Error", "Gemini couldn't", "🍌 I'm swamped")):
+                    completions.put(("error", params.get("thread_ts"), time.time(), text))
+                elif text.startswith("🍌 *Batch done*"):
+                    completions.put(("batch", params.get("thread_ts"), time.time(), text))
+                self._json({"ok": True, "channel": params.get("channel"), "ts": f"{time.time():.6f}"})
+            elif method == "chat.update":
+                self._json({"ok": True, "channel": params.get("channel"), "ts": params.get("ts")})
+            elif method == "conversations.replies":
+                self._json({"ok": True, "messages": [], "response_metadata": {"next_cursor": ""}})
+            elif method == "files.getUploadURLExternal":
+                file_id = f"FOUT{next_id()}"
+                self._json({"ok": True, "file_id": file_id, "upload_url": f"http://127.0.0.1:{port}/upload/{file_id}"})
+            elif method == "files.completeUploadExternal":
+                files = params.get("files")
+                files = json.loads(files) if isinstance(files, str) else files
+                completions.put(("upload", params.get("thread_ts"), time.time(), len(files)))
+                self._json({"ok": True, "files": [
+                    {"id": f["id"], "url_private": f"http://127.0.0.1:{port}/files-pri/TBENCH-{f['id']}/out.png"}
+                    for f in files
+                ]})
+            else:
+                self._json({"ok": True})
+
+        def _gemini(self, path: str, params: dict):
+            if random.random() < config["gemini_error_rate"]:
+                time.sleep(gemini_latency() / 10)
+                self._json({"error": {"code": 503, "message": "The model is overloaded.", "status": "UNAVAILABLE"}}, status=503)
+                return
+
+            if "image" not in path:
+                # Chat model - text only
+                time.sleep(config["chat_latency"])
+                self._json({"candidates": [{"content": {"role": "model", "parts": [{"text": "Hi from the bench!"}]}, "finishReason": "STOP"}]})
+                return
+
+            text_part = {"text": "Here's your edit."}
+            image_part = {"inlineData": {"mimeType": "image/png", "data": output_b64}}
+            latency = gemini_latency()
+            if (params.get("generationConfig") or {}).get("imageConfig", {}).get("imageSize") == "4K":
+                latency *= config["latency_4k_factor"]
+
+            if ":streamGenerateContent" not in path:
+                time.sleep(latency)
+                self._json({"candidates": [{"content": {"role": "model", "parts": [text_part, image_part]}, "finishReason": "STOP"}]})
+                return
+
+            # Server-sent events: text early, image when "done"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for delay, part in ((latency * 0.2, text_part), (latency * 0.8, image_part)):
+                time.sleep(delay)
+                chunk = f"data: {json.dumps({'candidates': [{'content': {'role': 'model', 'parts': [part]}}]})}\n\n".encode()
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+# Traffic
+
+def generate_traffic(args, stub_url: str) -> list[dict]:
+    """Mentions and DMs with one image each (or a `batch` of several), spaced at the target rate (Poisson arrivals)."""
+    traffic = []
+    offset = 0.0
+    base_ts = time.time()
+    for i in range(args.events):
+        ts = f"{base_ts + i:.6f}"
+        file_id = f"FIN{i % args.distinct_inputs if args.distinct_inputs else i}"
+        words = random.choice([["4k"], [], [], ["wide"]]) if args.mixed_resolution else []
+        files = [{"id": file_id, "mimetype": "image/png", "url_private": f"{stub_url}/files-pri/TBENCH-{file_id}/in.png"}]
+        if args.variants > 1:
+            words = words + [f"x{args.variants}"]
+        if args.batch:
+            words = words + ["batch"]
+            files = [dict(files[0], id=f"{file_id}-{n}", url_private=f"{stub_url}/files-pri/TBENCH-{file_id}-{n}/in.png") for n in range(args.batch)]
+
+        if random.random() < args.dm_ratio:
+            event = {"type": "message", "channel_type": "im", "channel": f"D{i % 50}", "user": f"U{i % args.users}",
+                     "text": " ".join(words + [f"make it purple #{i}"]), "ts": ts, "files": files, "client_msg_id": f"m{i}"}
+        else:
+            event = {"type": "app_mention", "channel": f"C{i % 5}", "user": f"U{i % args.users}",
+                     "text": " ".join(["<@UBOT>"] + words + [f"make it purple #{i}"]), "ts": ts, "files": files, "client_msg_id": f"m{i}"}
+
+        traffic.append({"offset": offset, "body": {
+            "type": "event_callback", "team_id": "TBENCH", "api_app_id": "ABENCH",
+            "event_id": f"Ev{i}", "event_time": int(base_ts), "event": event,
+        }})
+        offset += random.expovariate(args.rate)
+    return traffic
+
+
+def load_traffic(path: str, stub_url: str) -> list[dict]:
+    """Read recorded traffic, pointing any file URLs at the stand-in."""
+    traffic = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            for file in record["body"].get("event", {}).get("files", []):
+                if file.get("url_private"):
+                    file["url_private"] = stub_url + urlparse(file["url_private"]).path
+            traffic.append(record)
+    return sorted(traffic, key=lambda r: r["offset"])
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))]
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Peak RSS of this process, or with RUSAGE_CHILDREN of the largest child that has exited."""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024  # bytes on macOS, KB on Linux
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for Banana Bot")
+    parser.add_argument("--events", type=int, default=50, help="number of events to generate")
+    parser.add_argument("--rate", type=float, default=2.0, help="target events per second")
+    parser.add_argument("--replay", help="replay traffic from a JSONL file instead of generating it")
+    parser.add_argument("--save-events", help="write the generated traffic to a JSONL file for later replay")
+    parser.add_argument("--dm-ratio", type=float, default=0.0, help="fraction of events that are DMs instead of mentions")
+    parser.add_argument("--users", type=int, default=10, help="number of distinct users sending events")
+    parser.add_argument("--distinct-inputs", type=int, default=0, help="reuse this many input files (0 = every event gets its own)")
+    parser.add_argument("--mixed-resolution", action="store_true", help="mix in 4k and wide prompts")
+    parser.add_argument("--variants", type=int, default=1, help="ask for this many variants of each edit (x2, x3...)")
+    parser.add_argument("--batch", type=int, default=0, help="attach this many images to each event and ask for a batch edit")
+    parser.add_argument("--gemini-latency", type=float, default=5.0, help="mean seconds per image edit")
+    parser.add_argument("--gemini-jitter", type=float, default=1.0, help="standard deviation of edit latency")
+    parser.add_argument("--gemini-4k-factor", type=float, default=1.0, help="how many times longer a 4K edit takes")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="fraction of edits that get a 503")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="seconds per chat reply")
+    parser.add_argument("--slack-latency", type=float, default=0.05, help="seconds per Slack API call")
+    parser.add_argument("--download-latency", type=float, default=0.1, help="seconds before a file download starts")
+    parser.add_argument("--upload-mbps", type=float, default=50, help="simulated upload bandwidth in megabits/s")
+    parser.add_argument("--input-px", type=int, default=2048, help="size of the square input image")
+    parser.add_argument("--output-px", type=int, default=2048, help="size of the square image Gemini returns")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for everything to finish")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run async_app.py instead of app.py")
+    parser.add_argument("--cluster", type=int, default=0, help="run edits in this many worker processes, like cluster.py")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    config = {
+        "gemini_latency": args.gemini_latency,
+        "gemini_jitter": args.gemini_jitter,
+        "latency_4k_factor": args.gemini_4k_factor,
+        "gemini_error_rate": args.gemini_error_rate,
+        "chat_latency": args.chat_latency,
+        "slack_latency": args.slack_latency,
+        "download_latency": args.download_latency,
+        "upload_bytes_per_sec": args.upload_mbps * 1_000_000 / 8,
+        "input_px": args.input_px,
+        "output_px": args.output_px,
+    }
+    port_queue, completions = Queue(), Queue()
+    stubs = Process(target=run_stubs, args=(config, port_queue, completions), daemon=True)
+    stubs.start()
+    stub_url = f"http://127.0.0.1:{port_queue.get(timeout=60)}"
+
+    # Point the bot at the stand-ins before importing it, and keep its on-disk state out of the way
+    os.environ.update({
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_APP_TOKEN": "xapp-bench",
+        "GEMINI_API_KEY": "bench",
+        "SLACK_API_URL": f"{stub_url}/api/",
+        "GOOGLE_GEMINI_BASE_URL": stub_url,
+    })
+    for name in ("BANANA_IMAGE_CACHE_DIR", "BANANA_THREAD_INDEX_PATH", "BANANA_DEDUP_PATH", "BANANA_JOURNAL_DIR"):
+        os.environ.setdefault(name, "")
+    if args.cluster:
+        os.environ.setdefault("BANANA_QUEUE_PATH", os.path.join(tempfile.mkdtemp(prefix="banana-bench-"), "queue.db"))
+
+    if args.use_async:
+        from slack_bolt.request.async_request import AsyncBoltRequest
+        import async_app
+
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="bench-loop", daemon=True).start()
+        loop.call_soon_threadsafe(async_app.scheduler.start)
+
+        def dispatch(body: dict):
+            request = AsyncBoltRequest(body=body, mode="socket_mode")
+            asyncio.run_coroutine_threadsafe(async_app.app.async_dispatch(request), loop)
+    else:
+        from slack_bolt.request import BoltRequest
+        import app as bot
+
+        def dispatch(body: dict):
+            bot.app.dispatch(BoltRequest(body=body, mode="socket_mode"))
+
+        if args.cluster:
+            import cluster
+            cluster.setup_ingress(bot, args.cluster)
+            supervisor = cluster.Supervisor(args.cluster)
+
+    traffic = load_traffic(args.replay, stub_url) if args.replay else generate_traffic(args, stub_url)
+    if args.save_events:
+        with open(args.save_events, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in traffic)
+
+    sent = {}  # thread_ts -> time the event was dispatched
+    done = {}  # thread_ts -> (kind, time)
+    finished = Event()
+
+    def collect():
+        while len(done) < len(traffic):
+            kind, thread_ts, at, _ = completions.get()
+            # A batch is done when its summary is posted, not at its first upload
+            if args.batch and kind == "upload":
+                continue
+            if thread_ts not in done:
+                done[thread_ts] = (kind, at)
+        finished.set()
+
+    threading.Thread(target=collect, daemon=True).start()
+
+    print(f"Sending {len(traffic)} events to the bot...", file=sys.stderr)
+    started = time.time()
+    for record in traffic:
+        delay = started + record["offset"] - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        event = record["body"]["event"]
+        sent[event.get("thread_ts") or event["ts"]] = time.time()
+        dispatch(record["body"])
+    send_time = time.time() - started
+
+    if not finished.wait(args.timeout):
+        print(f"Timed out with {len(traffic) - len(done)} events unfinished", file=sys.stderr)
+    wall_time = max((at for _, at in done.values()), default=time.time()) - started
+
+    latencies = [at - sent[ts] for ts, (kind, at) in done.items() if kind in ("upload", "batch") and ts in sent]
+    summary = {
+        "events": len(traffic),
+        "completed": len(latencies),
+        "errors": sum(1 for kind, _ in done.values() if kind == "error"),
+        "unfinished": len(traffic) - len(done),
+        "offered_rate": round(len(traffic) / send_time, 2) if send_time else None,
+        "throughput": round(len(latencies) / wall_time, 2) if wall_time else None,
+        "p50_seconds": round(percentile(latencies, 50), 3),
+        "p99_seconds": round(percentile(latencies, 99), 3),
+        "max_seconds": round(max(latencies, default=float("nan")), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_worker_rss_mb": None,
+    }
+    if args.cluster:
+        # Workers only count towards RUSAGE_CHILDREN once they've exited; the stubs are still running
+        supervisor.stop()
+        summary["peak_worker_rss_mb"] = round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"events       {summary['events']} ({summary['completed']} uploaded, {summary['errors']} errors, {summary['unfinished']} unfinished)")
+        print(f"offered      {summary['offered_rate']} events/s")
+        print(f"throughput   {summary['throughput']} edits/s")
+        print(f"latency      p50 {summary['p50_seconds']:.3f}s  p99 {summary['p99_seconds']:.3f}s  max {summary['max_seconds']:.3f}s")
+        workers = f", largest worker {summary['peak_worker_rss_mb']} MB" if args.cluster else ""
+        print(f"peak RSS     {summary['peak_rss_mb']} MB bot process{workers}")
+    stubs.terminate()
+
+
+if __name__ == "__main__":
+    main()
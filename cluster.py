@@ -0,0 +1,173 @@
+"""Banana Bot across processes: `python cluster.py` instead of `python app.py`.
+
+This process holds the Socket Mode connection and queues edits in a SQLite
+file (BANANA_QUEUE_PATH). BANANA_PROCESSES worker processes lease them and run
+each with BANANA_EDIT_WORKERS threads, so decoding and transcoding use every
+core. Workers renew their leases while an edit runs; if one dies, it's
+restarted and its edits go back to the queue when their leases run out.
+"""
+import os
+import time
+import socket
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from job_queue import SQLiteJobQueue
+from thread_index import SharedThreadImageIndex
+
+# How often an idle worker checks the queue (seconds)
+POLL_INTERVAL = 0.2
+
+
+def share_thread_index(bot):
+    """Workers post to threads the other processes read, so the thread index lives in the queue's database."""
+    bot.thread_index = SharedThreadImageIndex(bot.QUEUE_PATH)
+
+
+def setup_ingress(bot, workers: int) -> SQLiteJobQueue:
+    """Make this process's submit_edit_job queue edits for the workers."""
+    share_thread_index(bot)
+    bot.journal = None  # the queue keeps edits across restarts
+    bot.job_queue = SQLiteJobQueue(
+        bot.QUEUE_PATH,
+        max_queue=bot.EDIT_QUEUE_SIZE,
+        workers=workers * bot.EDIT_WORKERS,
+        visibility_timeout=bot.QUEUE_VISIBILITY_TIMEOUT,
+        max_attempts=bot.QUEUE_MAX_ATTEMPTS,
+        weights=bot.parse_weights(bot.TENANT_WEIGHTS),
+    )
+    # Edits happen in the workers, so the queue is all the load this process can see
+    bot.load_policy.depth = bot.job_queue.depth
+    bot.load_policy.latency = lambda: None
+    bot.metrics.gauge("banana_queue_depth", bot.job_queue.depth)
+    bot.metrics.gauge("banana_workers_busy", bot.job_queue.leased)
+    return bot.job_queue
+
+
+def run_worker(index: int):
+    """Worker process: lease edits from the queue and run them until killed."""
+    import app as bot
+
+    share_thread_index(bot)
+    bot.journal = None
+    queue = SQLiteJobQueue(
+        bot.QUEUE_PATH,
+        visibility_timeout=bot.QUEUE_VISIBILITY_TIMEOUT,
+        max_attempts=bot.QUEUE_MAX_ATTEMPTS,
+    )
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    if bot.METRICS_PORT:
+        bot.metrics.serve(bot.METRICS_PORT + 1 + index)
+    bot.bot_identity.resolve(bot.app.client)
+
+    held = set()  # job IDs this process is running
+    held_lock = threading.Lock()
+    slots = threading.Semaphore(bot.EDIT_WORKERS)
+    pool = ThreadPoolExecutor(max_workers=bot.EDIT_WORKERS, thread_name_prefix=f"banana-worker-{index}")
+
+    def heartbeat():
+        while True:
+            time.sleep(bot.QUEUE_VISIBILITY_TIMEOUT / 3)
+            with held_lock:
+                job_ids = list(held)
+            try:
+                queue.heartbeat(job_ids, owner)
+            except Exception as e:
+                print(f"Error renewing leases: {e}")
+
+    def run(job_id: int, job: dict):
+        try:
+            bot.run_edit_job(job, bot.app.client)
+            queue.ack(job_id, owner)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            queue.release(job_id, owner)
+        finally:
+            with held_lock:
+                held.discard(job_id)
+            slots.release()
+
+    def give_up(job_id: int, job: dict, attempts: int):
+        try:
+            bot.app.client.chat_postMessage(channel=job["channel_id"], thread_ts=job["thread_ts"], text=bot.give_up_message(attempts))
+        except Exception as e:
+            print(f"Error posting to {job['channel_id']}: {e}")
+
+    threading.Thread(target=heartbeat, name="banana-heartbeat", daemon=True).start()
+    print(f"Worker {index} ({owner}) running {bot.EDIT_WORKERS} edits at a time")
+
+    while True:
+        slots.acquire()
+        try:
+            leased = queue.lease(owner, give_up)
+        except Exception as e:
+            print(f"Error leasing a job: {e}")
+            leased = None
+        if leased is None:
+            slots.release()
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        job_id, job, attempt = leased
+        if attempt > 1:
+            print(f"Retrying job {job_id} (attempt {attempt})")
+        with held_lock:
+            held.add(job_id)
+        pool.submit(run, job_id, job)
+
+
+class Supervisor:
+    """Starts the worker processes and restarts any that exit."""
+
+    def __init__(self, count: int):
+        self.count = count
+        self._stopping = False
+        # spawn, not fork: the parent already has threads running
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = [self._start(i) for i in range(count)]
+        threading.Thread(target=self._watch, name="banana-supervisor", daemon=True).start()
+
+    def _start(self, index: int):
+        process = self._context.Process(target=run_worker, args=(index,), name=f"banana-worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    def _watch(self):
+        while not self._stopping:
+            time.sleep(1)
+            for i, process in enumerate(self._processes):
+                if not process.is_alive() and not self._stopping:
+                    print(f"Worker {i} exited with code {process.exitcode}, restarting")
+                    self._processes[i] = self._start(i)
+
+    def stop(self):
+        """Terminate the workers and wait for them to exit."""
+        self._stopping = True
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join(10)
+
+
+if __name__ == "__main__":
+    import app as bot
+    from slack_bolt.adapter.socket_mode import SocketModeHandler
+
+    count = bot.PROCESSES or os.cpu_count() or 1
+    setup_ingress(bot, count)
+    supervisor = Supervisor(count)
+
+    print("⚡ Banana Bot is running across processes!")
+    print(f"   • {count} worker processes × {bot.EDIT_WORKERS} edits, up to {bot.EDIT_QUEUE_SIZE} queued in {bot.QUEUE_PATH}")
+    if bot.METRICS_PORT:
+        bot.metrics.serve(bot.METRICS_PORT)
+        print(f"   • Metrics on http://127.0.0.1:{bot.METRICS_PORT}/metrics (workers on the next {count} ports)")
+
+    identity = bot.bot_identity.resolve(bot.app.client)
+    print(f"   • Connected as <@{identity['user_id']}> in {identity['team'] or identity['team_id']}")
+
+    try:
+        SocketModeHandler(bot.app, bot.SLACK_APP_TOKEN).start()
+    finally:
+        supervisor.stop()
@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class EventDedup:
+    """Remembers event keys for a time window so redelivered Slack events are only handled once.
+
+    With a path, keys are also appended to a log file and reloaded on startup,
+    so a restart mid-deploy doesn't process Slack's retries a second time.
+    """
+
+    def __init__(self, window: float = 600, max_entries: int = 10000, path: str | None = None):
+        self.window = window
+        self.max_entries = max_entries
+        self.path = path
+        self._seen = OrderedDict()  # key -> wall-clock time first seen, oldest first
+        self._lock = threading.Lock()
+        self._log = None
+        self._log_lines = 0
+
+        if path:
+            self._load()
+            self._compact()
+
+    def check_and_add(self, keys: list[str]) -> bool:
+        """Return True if any key was seen within the window; otherwise remember them all."""
+        keys = [key for key in keys if key]
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if any(key in self._seen for key in keys):
+                return True
+            for key in keys:
+                self._seen[key] = now
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            if self._log:
+                self._append(keys, now)
+        return False
+
+    def _expire(self, now: float):
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.window:
+                break
+            del self._seen[key]
+
+    def _append(self, keys: list[str], now: float):
+        try:
+            self._log.write("".join(f"{now:.3f}\t{key}\n" for key in keys))
+            self._log.flush()
+            self._log_lines += len(keys)
+            # Rewrite the log once it's mostly expired entries
+            if self._log_lines > 2 * self.max_entries:
+                self._compact()
+        except OSError as e:
+            print(f"Error writing dedup log: {e}")
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    seen_at, _, key = line.rstrip("\n").partition("\t")
+                    try:
+                        self._seen[key] = float(seen_at)
+                    except ValueError:
+                        continue  # torn write from a crash
+        except FileNotFoundError:
+            return
+        self._expire(time.time())
+
+    def _compact(self):
+        """Rewrite the log with only live keys and reopen it for appending."""
+        if self._log:
+            self._log.close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{seen_at:.3f}\t{key}\n" for key, seen_at in self._seen.items())
+        os.replace(tmp_path, self.path)
+        self._log = open(self.path, "a")
+        self._log_lines = len(self._seen)
@@ -0,0 +1,115 @@
+import time
+import asyncio
+import aiohttp
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+MB = 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+
+
+class DownloadError(Exception):
+    """Raised when a download is too large or too slow."""
+
+
+class Downloader:
+    """Fetches files over a shared keep-alive session, several at a time."""
+
+    def __init__(self, max_bytes: int, timeout: float = 30.0, pool_size: int = 16):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+
+        # One pooled session so repeat downloads reuse TLS connections to Slack's CDN
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="banana-download")
+
+    def fetch(self, url: str, headers: dict | None = None) -> bytes:
+        """Download one file, enforcing the byte cap and an overall deadline."""
+        deadline = time.monotonic() + self.timeout
+
+        with self.session.get(url, headers=headers, stream=True, timeout=(5, self.timeout)) as response:
+            response.raise_for_status()
+
+            length = response.headers.get("Content-Length")
+            length = int(length) if length and length.isdigit() else None
+            if length is not None and length > self.max_bytes:
+                raise DownloadError(f"File is {length / MB:.1f}MB, the limit is {self.max_bytes / MB:.0f}MB")
+
+            # Preallocate when the size is known so we don't build a list of chunks and join
+            buffer = bytearray(length or 0)
+            pos = 0
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                end = pos + len(chunk)
+                if end > self.max_bytes:
+                    raise DownloadError(f"File is over the {self.max_bytes / MB:.0f}MB limit")
+                if time.monotonic() > deadline:
+                    raise DownloadError(f"Download took longer than {self.timeout:.0f}s")
+                buffer[pos:end] = chunk
+                pos = end
+
+        if pos != len(buffer):
+            del buffer[pos:]
+        return bytes(buffer)
+
+    def fetch_all(self, urls: list[str], headers: dict | None = None) -> list[bytes]:
+        """Download all files concurrently. Results are in the same order as urls."""
+        if len(urls) == 1:
+            return [self.fetch(urls[0], headers)]
+        futures = [self._executor.submit(self.fetch, url, headers) for url in urls]
+        return [future.result() for future in futures]
+
+
+class AsyncDownloader:
+    """Downloader for coroutines, over one aiohttp session per event loop."""
+
+    def __init__(self, max_bytes: int, timeout: float = 30.0, pool_size: int = 64):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=5),
+            )
+        return self._session
+
+    async def fetch(self, url: str, headers: dict | None = None) -> bytes:
+        """Download one file, enforcing the byte cap and an overall deadline."""
+        try:
+            async with self.session().get(url, headers=headers) as response:
+                response.raise_for_status()
+
+                length = response.content_length
+                if length is not None and length > self.max_bytes:
+                    raise DownloadError(f"File is {length / MB:.1f}MB, the limit is {self.max_bytes / MB:.0f}MB")
+
+                buffer = bytearray(length or 0)
+                pos = 0
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    end = pos + len(chunk)
+                    if end > self.max_bytes:
+                        raise DownloadError(f"File is over the {self.max_bytes / MB:.0f}MB limit")
+                    buffer[pos:end] = chunk
+                    pos = end
+        except asyncio.TimeoutError:
+            raise DownloadError(f"Download took longer than {self.timeout:.0f}s")
+
+        if pos != len(buffer):
+            del buffer[pos:]
+        return bytes(buffer)
+
+    async def fetch_all(self, urls: list[str], headers: dict | None = None) -> list[bytes]:
+        """Download all files concurrently. Results are in the same order as urls."""
+        return list(await asyncio.gather(*(self.fetch(url, headers) for url in urls)))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
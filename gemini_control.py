@@ -0,0 +1,183 @@
+import time
+import random
+import asyncio
+import threading
+import httpx
+import aiohttp
+from google.genai import errors
+
+# Status codes worth retrying; 429 and 503 also mean we're sending too much
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+OVERLOAD_CODES = {429, 503}
+
+
+class AdaptiveLimiter:
+    """Caps in-flight requests to one model, adjusting the cap AIMD-style.
+
+    Until the first back-off, each fast success adds a slot, doubling the cap
+    every round trip (slow start), so a cold limiter with a high max reaches
+    it in seconds. After that, each fast success adds about one slot per
+    round trip (additive increase). A 429/503, a timeout, or latency well above the best we've seen halves
+    the cap (multiplicative decrease), at most once per cooldown period so a
+    single burst of errors doesn't collapse it to the minimum.
+    """
+
+    def __init__(self, name: str, initial: int = 4, min_limit: int = 1, max_limit: int = 16,
+                 latency_tolerance: float = 2.0, cooldown: float = 5.0):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.avg_latency = None  # EWMA of successful calls
+        self.best_latency = None  # lowest EWMA seen, our idea of an unloaded call
+        self._last_decrease = 0.0
+        self._slow_start = True
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout: float) -> bool:
+        """Wait for a free slot. Returns False if none opened up within timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency: float | None, overloaded: bool = False):
+        """Free a slot and adjust the cap from how the call went.
+
+        `latency` is None for a call that failed some other way: how long a
+        quick error took says nothing about how loaded the model is.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._adjust(latency, overloaded)
+            self._cond.notify_all()
+
+    def _adjust(self, latency: float | None, overloaded: bool):
+        if overloaded:
+            self._decrease()
+        elif latency is not None:
+            self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+            self.best_latency = self.avg_latency if self.best_latency is None else min(self.best_latency, self.avg_latency)
+            if self.avg_latency > self.best_latency * self.latency_tolerance:
+                self._decrease()
+            else:
+                self.limit = min(self.max_limit, self.limit + (1 if self._slow_start else 1 / self.limit))
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._slow_start = False
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit / 2)
+        # Let the baseline drift up again so one lucky fast call doesn't pin us low forever
+        if self.best_latency is not None and self.avg_latency is not None:
+            self.best_latency = (self.best_latency + self.avg_latency) / 2
+        if int(self.limit) < previous:
+            print(f"{self.name}: backing off to {int(self.limit)} concurrent requests")
+
+
+class AsyncAdaptiveLimiter(AdaptiveLimiter):
+    """AdaptiveLimiter for coroutines - waiting for a slot doesn't hold a thread."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, timeout: float) -> bool:
+        async with self._cond:
+            try:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self.in_flight < int(self.limit)), timeout)
+            except asyncio.TimeoutError:  # not the builtin TimeoutError before Python 3.11
+                return False
+            self.in_flight += 1
+            return True
+
+    async def release(self, latency: float | None, overloaded: bool = False):
+        async with self._cond:
+            self.in_flight -= 1
+            self._adjust(latency, overloaded)
+            self._cond.notify_all()
+
+
+def is_retryable(e: Exception) -> bool:
+    if isinstance(e, errors.APIError):
+        return e.code in RETRYABLE_CODES
+    # The async client talks to Gemini over aiohttp when it's installed
+    return isinstance(e, (httpx.TimeoutException, httpx.TransportError, aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def is_overload(e: Exception) -> bool:
+    if isinstance(e, errors.APIError):
+        return e.code in OVERLOAD_CODES
+    return isinstance(e, (httpx.TimeoutException, asyncio.TimeoutError))
+
+
+def call_with_retry(fn, limiter: AdaptiveLimiter, deadline: float, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 20.0):
+    """Call fn(timeout_seconds) under the limiter, retrying transient errors with jittered backoff.
+
+    Every attempt, wait and backoff comes out of the same `deadline` seconds,
+    so a request never runs longer than that in total.
+    """
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0 or not limiter.acquire(remaining):
+            raise TimeoutError(f"{limiter.name} didn't respond within {deadline:.0f}s")
+
+        started = time.monotonic()
+        try:
+            result = fn(give_up_at - started)
+        except Exception as e:
+            limiter.release(None, overloaded=is_overload(e))
+            if not is_retryable(e) or attempt >= max_attempts:
+                raise
+            # Full jitter: spread retries out so a burst of failures doesn't come back in lockstep
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if time.monotonic() + delay >= give_up_at:
+                raise
+            print(f"{limiter.name} attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        limiter.release(time.monotonic() - started)
+        return result
+
+
+async def async_call_with_retry(fn, limiter: AsyncAdaptiveLimiter, deadline: float, max_attempts: int = 4, base_delay: float = 1.0, max_delay: float = 20.0):
+    """call_with_retry for coroutines: awaits fn(timeout_seconds) under an AsyncAdaptiveLimiter."""
+    give_up_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0 or not await limiter.acquire(remaining):
+            raise TimeoutError(f"{limiter.name} didn't respond within {deadline:.0f}s")
+
+        started = time.monotonic()
+        try:
+            result = await fn(give_up_at - started)
+        except Exception as e:
+            await limiter.release(None, overloaded=is_overload(e))
+            if not is_retryable(e) or attempt >= max_attempts:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if time.monotonic() + delay >= give_up_at:
+                raise
+            print(f"{limiter.name} attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        await limiter.release(time.monotonic() - started)
+        return result
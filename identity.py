@@ -0,0 +1,39 @@
+import threading
+
+
+class BotIdentity:
+    """Who the bot is (user, bot and team IDs), from one auth.test call shared by every handler.
+
+    The result is cached per token and only re-fetched when a client with a
+    different token asks, so the request path never calls auth.test itself.
+    """
+
+    def __init__(self):
+        self._token = None
+        self._info = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, client) -> dict:
+        """Return identity info for client's token, calling auth.test only if the token changed."""
+        token = getattr(client, "token", None)
+        with self._lock:
+            if self._info and token == self._token:
+                return self._info
+
+            result = client.auth_test()
+            self._info = {
+                "user_id": result.get("user_id"),
+                "bot_id": result.get("bot_id"),
+                "team_id": result.get("team_id"),
+                "team": result.get("team"),
+                "enterprise_id": result.get("enterprise_id"),
+                "url": result.get("url"),
+            }
+            self._token = token
+            return self._info
+
+    def user_id(self, client) -> str | None:
+        return self.resolve(client)["user_id"]
+
+    def team_id(self, client) -> str | None:
+        return self.resolve(client)["team_id"]
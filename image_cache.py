@@ -0,0 +1,168 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Slack private URLs look like https://files.slack.com/files-pri/T0123-F0456/name.png
+SLACK_FILE_ID_RE = re.compile(r"/files-pri/[A-Z0-9]+-(F[A-Z0-9]+)/")
+
+# A temp file this old belongs to a write that's never going to finish
+TMP_MAX_AGE = 3600
+
+
+def cache_key(url: str) -> str:
+    """Slack file ID for a private URL, or a hash of the URL if it doesn't have one."""
+    match = SLACK_FILE_ID_RE.search(url)
+    if match:
+        return match.group(1)
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+class MemoryCache:
+    """LRU of raw bytes, bounded by total size rather than entry count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        # Don't let one huge file flush everything else
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class DiskCache:
+    """Directory of files named by key, evicting least recently used once over max_bytes.
+
+    Worker processes share the directory, so nobody's running total can be
+    trusted for long: once this process's estimate passes max_bytes it
+    re-reads the directory and trims it by mtime (reads touch it) down to
+    `low_water` of the budget, which leaves room for everyone's writes before
+    the next scan.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, low_water: float = 0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.size = None  # estimated bytes on disk, None until first use
+        self._lock = threading.Lock()
+
+    def _open(self):
+        """Create the directory and size it up, the first time through. Call holding _lock."""
+        if self.size is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = 0
+        self._evict(self.max_bytes, own_tmp=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # keep LRU order, for every process
+        except FileNotFoundError:
+            pass  # another process evicted it meanwhile
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._open()
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                self._evict(self.max_bytes * self.low_water)
+
+    def _evict(self, target: float, own_tmp: bool = False):
+        """Re-read the directory and delete the least recently used files until it holds at most `target` bytes.
+
+        Temp files are other processes' writes in progress and left alone,
+        unless they're long abandoned or `own_tmp` is set and they carry this
+        process's PID (left by an earlier process that had it).
+        """
+        own = re.compile(rf".+\.{os.getpid()}\.\d+\.tmp")
+        stale = time.time() - TMP_MAX_AGE
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                if name.endswith(".tmp"):
+                    if stat.st_mtime < stale or (own_tmp and own.fullmatch(name)):
+                        os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue  # evicted or renamed by another process meanwhile
+            files.append((stat.st_mtime, path, stat.st_size))
+
+        self.size = sum(size for _, _, size in files)
+        if self.size <= target:
+            return
+        for _, path, size in sorted(files):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            if self.size <= target:
+                break
+
+
+class ImageCache:
+    """Two-tier cache for downloaded images: memory first, then disk."""
+
+    def __init__(self, memory_bytes: int, disk_dir: str | None = None, disk_bytes: int = 0):
+        self.memory = MemoryCache(memory_bytes)
+        self.disk = DiskCache(disk_dir, disk_bytes) if disk_dir and disk_bytes > 0 else None
+
+    def get(self, key: str) -> bytes | None:
+        data = self.memory.get(key)
+        if data is not None:
+            return data
+        if self.disk:
+            data = self.disk.get(key)
+            if data is not None:
+                self.memory.put(key, data)  # promote
+        return data
+
+    def put(self, key: str, data: bytes):
+        self.memory.put(key, data)
+        if self.disk:
+            try:
+                self.disk.put(key, data)
+            except OSError as e:
+                print(f"Error writing image cache: {e}")
@@ -0,0 +1,87 @@
+import re
+import random
+import threading
+from collections import OrderedDict
+
+GREETING_REPLIES = [
+    "Hey! Send me an image with a prompt and I'll edit it for you.",
+    "Hi there! Got an image that needs some banana magic?",
+    "Hey hey! Attach an image and tell me what to change.",
+    "Yo! What are we editing today?",
+    "Hello! I'm ripe and ready — drop an image and a prompt.",
+]
+
+THANKS_REPLIES = [
+    "Anytime! 🍌",
+    "Happy to help!",
+    "You got it — peel free to come back anytime.",
+    "Glad you like it!",
+    "No problem, that's what bananas are for.",
+]
+
+HELP_REPLY = """Here's how I work:
+• Attach an image and tell me what to change, e.g. _make the sky purple_
+• Attach several images to merge or combine them, or start with `batch` to edit each one separately
+• Add `4k` for 4K output, or `wide`, `tall`, `square`, `16:9`, `4:3`… for an aspect ratio
+• Add `x2`, `x3`… to get several takes on the same edit at once
+• Start with `fresh` to skip cached results and get a brand new edit
+• Add `lossless` to also get the full-quality PNG
+• Reply in the thread to keep editing the last result — I remember the earlier steps
+I only edit images — I can't generate them from scratch."""
+
+# Whole-message patterns only, so "hi can you make this a cat" still goes to the model
+INTENTS = [
+    (re.compile(r"(hi+|hey+|hello+|howdy|yo+|sup|hiya|heya|gm|good (morning|afternoon|evening))( there| banana( bot)?| everyone| all)?"), GREETING_REPLIES),
+    (re.compile(r"((thanks|thank you|thx|ty|tysm|cheers)( so much| a lot| very much)?( banana( bot)?)?|(nice|great|good|awesome|amazing|perfect|love it|cool)( job| work| one| bot| stuff)?|good bot)"), THANKS_REPLIES),
+    (re.compile(r"(help|usage|commands|how (do|does) (i|this|it) work|how do i use (you|this)|what can you do)"), [HELP_REPLY]),
+]
+
+
+def normalize_message(message: str) -> str:
+    """Casefold, drop mentions, punctuation and emoji, and collapse whitespace. Letters in any script are kept."""
+    text = re.sub(r"<@[A-Z0-9]+>|:[a-z0-9_+-]+:", " ", message).casefold()
+    text = re.sub(r"[^\w'’ ]+|_", " ", text)
+    return " ".join(re.sub(r"['’]", "", text).split())
+
+
+def local_reply(message: str) -> str | None:
+    """Answer greetings, thanks and help requests from templates. Returns None if the model should answer.
+
+    Only a message with nothing in it but mentions gets a greeting - one that's all
+    emoji or punctuation still goes to the model."""
+    if not re.sub(r"<@[A-Z0-9]+>", "", message).strip():
+        return random.choice(GREETING_REPLIES)
+    text = normalize_message(message)
+    for pattern, replies in INTENTS:
+        if pattern.fullmatch(text):
+            return random.choice(replies)
+    return None
+
+
+class ReplyCache:
+    """LRU of model chat replies, keyed by normalized message."""
+
+    def __init__(self, max_entries: int = 500):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, message: str) -> str | None:
+        key = self._key(message)
+        with self._lock:
+            reply = self._entries.get(key)
+            if reply is not None:
+                self._entries.move_to_end(key)
+            return reply
+
+    def put(self, message: str, reply: str):
+        key = self._key(message)
+        with self._lock:
+            self._entries[key] = reply
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _key(self, message: str) -> str:
+        # An all-emoji message normalizes to nothing, so it's keyed by what was sent
+        return normalize_message(message) or message.strip()
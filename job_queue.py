@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from jobs import QueueFull
+
+
+class SQLiteJobQueue:
+    """Durable job queue in a local SQLite file, shared by the ingress and worker processes.
+
+    Workers lease a job for `visibility_timeout` seconds and must ack it when
+    done, or heartbeat to keep the lease while it's still running. A lease that
+    runs out (the worker crashed or hung) makes the job visible again, so
+    every job is processed at least once; it's given up on after
+    `max_attempts` leases. Waiting jobs are leased in weighted-fair order
+    across users and channels, tagged when they're queued.
+    """
+
+    def __init__(self, path: str, max_queue: int = 20, workers: int = 0, visibility_timeout: float = 60.0,
+                 max_attempts: int = 3, weights: dict[str, float] | None = None):
+        self.path = path
+        self.max_queue = max_queue
+        self.workers = workers  # job slots across all worker processes, for queue positions
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.weights = weights or {}
+        self._vtime = 0.0  # start tag of the newest job a worker has picked up
+        self._finish = {}  # tenant -> finish tag of its last queued job (only the ingress queues jobs)
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._db()
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                start REAL NOT NULL,
+                finish REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_until REAL NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL
+            )
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_order ON jobs (finish, id)")
+
+    def _db(self) -> sqlite3.Connection:
+        """This thread's connection. WAL lets workers read while another process writes."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def put(self, job: dict, user: str = "", channel: str = "", cost: float = 1.0) -> int:
+        """Queue a JSON-serializable job. Returns its queue position (0 = a worker can start it now)."""
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            waiting = db.execute("SELECT COUNT(*) FROM jobs WHERE lease_until <= ?", (now,)).fetchone()[0]
+            if waiting >= self.max_queue:
+                raise QueueFull(f"{waiting} jobs already waiting")
+
+            leased_vtime = db.execute("SELECT COALESCE(MAX(start), 0) FROM jobs WHERE attempts > 0").fetchone()[0]
+            self._vtime = max(self._vtime, leased_vtime)
+            user_key, channel_key = f"user:{user}", f"channel:{channel}"
+            start = max(self._vtime, self._finish.get(user_key, 0.0), self._finish.get(channel_key, 0.0))
+            self._finish[user_key] = start + cost / self.weights.get(user, 1.0)
+            self._finish[channel_key] = start + cost / self.weights.get(channel, 1.0)
+            finish = max(self._finish[user_key], self._finish[channel_key])
+
+            # Jobs ahead of this one that won't get an idle worker
+            ahead = db.execute("SELECT COUNT(*) FROM jobs WHERE lease_until <= ? AND finish <= ?", (now, finish)).fetchone()[0]
+            position = ahead
+            if self.workers:
+                idle = self.workers - db.execute("SELECT COUNT(*) FROM jobs WHERE lease_until > ?", (now,)).fetchone()[0]
+                position = max(0, ahead - idle + 1)
+            db.execute(
+                "INSERT INTO jobs (payload, start, finish, enqueued_at) VALUES (?, ?, ?, ?)",
+                (json.dumps(job), start, finish, now),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        if len(self._finish) > 4 * self.max_queue + 100:
+            self._finish = {t: f for t, f in self._finish.items() if f > self._vtime}
+        return position
+
+    def lease(self, owner: str, give_up=None) -> tuple[int, dict, int] | None:
+        """Take the next visible job for `owner`. Returns (job_id, job, attempt) or None if there's nothing to do.
+
+        Jobs dropped on the way for running out of attempts are passed to
+        `give_up(job_id, job, attempts)` once they're gone from the queue, so
+        the caller can tell the user.
+        """
+        db = self._db()
+        # Cheap read first, so idle workers polling don't keep taking the write lock
+        if db.execute("SELECT 1 FROM jobs WHERE lease_until <= ? LIMIT 1", (time.time(),)).fetchone() is None:
+            return None
+
+        dropped = []
+        leased = None
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            while True:
+                row = db.execute(
+                    "SELECT id, payload, attempts FROM jobs WHERE lease_until <= ? ORDER BY finish, id LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    break
+
+                job_id, payload, attempts = row
+                if attempts >= self.max_attempts:
+                    # Leased and lost too many times - probably crashes the worker
+                    print(f"Giving up on job {job_id} after {attempts} attempts")
+                    db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                    dropped.append((job_id, json.loads(payload), attempts))
+                    continue
+
+                db.execute(
+                    "UPDATE jobs SET attempts = attempts + 1, owner = ?, lease_until = ? WHERE id = ?",
+                    (owner, now + self.visibility_timeout, job_id),
+                )
+                leased = job_id, json.loads(payload), attempts + 1
+                break
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        # Outside the transaction, so telling the user doesn't hold the write lock
+        if give_up is not None:
+            for job_id, job, attempts in dropped:
+                give_up(job_id, job, attempts)
+        return leased
+
+    def heartbeat(self, job_ids: list[int], owner: str):
+        """Extend the leases `owner` still holds on these jobs."""
+        if not job_ids:
+            return
+        marks = ",".join("?" * len(job_ids))
+        self._db().execute(
+            f"UPDATE jobs SET lease_until = ? WHERE owner = ? AND id IN ({marks})",
+            (time.time() + self.visibility_timeout, owner, *job_ids),
+        )
+
+    def ack(self, job_id: int, owner: str):
+        """The job is finished - remove it, unless the lease was lost to another worker meanwhile."""
+        self._db().execute("DELETE FROM jobs WHERE id = ? AND owner = ?", (job_id, owner))
+
+    def release(self, job_id: int, owner: str):
+        """Give a job back so another worker can retry it straight away."""
+        self._db().execute("UPDATE jobs SET owner = NULL, lease_until = 0 WHERE id = ? AND owner = ?", (job_id, owner))
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._db().execute("SELECT COUNT(*) FROM jobs WHERE lease_until <= ?", (time.time(),)).fetchone()[0]
+
+    def leased(self) -> int:
+        """Number of jobs a worker is running."""
+        return self._db().execute("SELECT COUNT(*) FROM jobs WHERE lease_until > ?", (time.time(),)).fetchone()[0]
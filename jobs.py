@@ -0,0 +1,267 @@
+import time
+import asyncio
+import itertools
+import threading
+from contextlib import nullcontext
+
+
+class QueueFull(Exception):
+    """Raised when the scheduler can't accept any more jobs."""
+
+
+class TokenBucket:
+    """Allows `rate` tokens per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available (0 if they are now)."""
+        self._refill(now)
+        cost = min(cost, self.burst)  # a job bigger than the bucket waits for a full one
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float, now: float):
+        self._refill(now)
+        self.tokens -= min(cost, self.burst)
+
+
+class _Job:
+    __slots__ = ("fn", "args", "user", "channel", "cost", "start", "finish", "seq", "enqueued_at")
+
+
+class JobScheduler:
+    """Runs jobs on a fixed pool of worker threads, sharing them fairly between users and channels.
+
+    Waiting jobs are ordered by weighted fair queuing: each job gets a virtual
+    finish tag from its cost and the backlog its user and channel already have,
+    so someone with twenty queued 4K edits doesn't hold up everyone else's
+    first one. Optional per-user and per-channel token buckets cap how fast
+    each can spend - a job whose buckets are empty waits while others run.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 20, name: str = "banana-worker",
+                 weights: dict[str, float] | None = None,
+                 user_rate: float = 0, user_burst: float = 0,
+                 channel_rate: float = 0, channel_burst: float = 0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.name = name
+        self.weights = weights or {}
+        self.user_limit = (user_rate, user_burst) if user_rate > 0 else None
+        self.channel_limit = (channel_rate, channel_burst) if channel_rate > 0 else None
+
+        self._queue = []
+        self._cond = self._condition()
+        self._busy = 0
+        self._seq = itertools.count()
+        self._vtime = 0.0  # virtual time: start tag of the last job dispatched
+        self._finish = {}  # tenant -> finish tag of its last queued job
+        self._buckets = {}  # tenant -> TokenBucket
+        self._stats = {}  # tenant -> {"queued", "dispatched", "avg_wait", "last_wait"}
+        self._start_workers()
+
+    def _condition(self):
+        return threading.Condition()
+
+    def _start_workers(self):
+        self._threads = []  # started by the first submit, so a scheduler nobody uses costs no threads
+
+    def _ensure_workers(self):
+        if not self._threads:
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, fn, *args, user: str = "", channel: str = "", cost: float = 1.0) -> int:
+        """Queue fn(*args) for a user and channel. Returns its queue position (0 = starting right away)."""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFull(f"{len(self._queue)} jobs already waiting")
+            self._ensure_workers()
+
+            job = _Job()
+            job.fn, job.args = fn, args
+            job.user, job.channel = f"user:{user}", f"channel:{channel}"
+            job.cost = cost
+            job.seq = next(self._seq)
+            job.enqueued_at = time.monotonic()
+
+            # Start after both the user's and the channel's earlier jobs, finish in proportion to cost
+            job.start = max(self._vtime, self._finish.get(job.user, 0.0), self._finish.get(job.channel, 0.0))
+            user_finish = job.start + cost / self.weights.get(user, 1.0)
+            channel_finish = job.start + cost / self.weights.get(channel, 1.0)
+            self._finish[job.user] = user_finish
+            self._finish[job.channel] = channel_finish
+            job.finish = max(user_finish, channel_finish)
+
+            for tenant in (job.user, job.channel):
+                self._tenant_stats(tenant)["queued"] += 1
+
+            # Jobs ahead of this one that won't get an idle worker
+            ahead = sum(1 for other in self._queue if (other.finish, other.seq) < (job.finish, job.seq))
+            idle = self.workers - self._busy
+            position = max(0, ahead - idle + 1)
+
+            self._queue.append(job)
+            self._wake()
+            return position
+
+    def _wake(self):
+        self._cond.notify()
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        with self._cond:
+            return len(self._queue)
+
+    def busy(self) -> int:
+        """Number of workers currently running a job."""
+        with self._cond:
+            return self._busy
+
+    def tenant_stats(self) -> dict[str, dict]:
+        """Queue depth and wait times per tenant, keyed "user:<id>" / "channel:<id>"."""
+        now = time.monotonic()
+        with self._cond:
+            stats = {tenant: dict(s, oldest_wait=0.0) for tenant, s in self._stats.items()}
+            for job in self._queue:
+                for tenant in (job.user, job.channel):
+                    stats[tenant]["oldest_wait"] = max(stats[tenant]["oldest_wait"], now - job.enqueued_at)
+            return stats
+
+    def _tenant_stats(self, tenant: str) -> dict:
+        stats = self._stats.get(tenant)
+        if stats is None:
+            stats = self._stats[tenant] = {"queued": 0, "dispatched": 0, "avg_wait": 0.0, "last_wait": 0.0}
+        return stats
+
+    def _bucket(self, tenant: str, limit: tuple[float, float] | None) -> TokenBucket | None:
+        if limit is None:
+            return None
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            bucket = self._buckets[tenant] = TokenBucket(*limit)
+        return bucket
+
+    def _next_job(self, now: float) -> tuple[_Job | None, float]:
+        """Pick the eligible job with the smallest finish tag. Otherwise return how long to wait."""
+        wait = None
+        for job in sorted(self._queue, key=lambda j: (j.finish, j.seq)):
+            buckets = [self._bucket(job.user, self.user_limit), self._bucket(job.channel, self.channel_limit)]
+            delay = max((b.wait_time(job.cost, now) for b in buckets if b), default=0.0)
+            if delay == 0:
+                for bucket in buckets:
+                    if bucket:
+                        bucket.take(job.cost, now)
+                return job, 0.0
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _dispatched(self, job: _Job, now: float):
+        self._queue.remove(job)
+        self._vtime = max(self._vtime, job.start)
+
+        waited = now - job.enqueued_at
+        for tenant in (job.user, job.channel):
+            stats = self._tenant_stats(tenant)
+            stats["queued"] -= 1
+            stats["dispatched"] += 1
+            stats["last_wait"] = waited
+            stats["avg_wait"] = waited if stats["dispatched"] == 1 else 0.8 * stats["avg_wait"] + 0.2 * waited
+
+        # Forget finish tags that are already in the past so the dict doesn't grow forever
+        if len(self._finish) > 4 * (len(self._queue) + self.workers) + 100:
+            self._finish = {t: f for t, f in self._finish.items() if f > self._vtime}
+        # Likewise stats for tenants with nothing queued, and buckets that have refilled
+        # (a new bucket starts full, so those are no different)
+        if len(self._stats) > 4 * (len(self._queue) + self.workers) + 100:
+            self._stats = {t: s for t, s in self._stats.items() if s["queued"] > 0}
+        if len(self._buckets) > 4 * (len(self._queue) + self.workers) + 100:
+            self._buckets = {t: b for t, b in self._buckets.items() if b.wait_time(b.burst, now) > 0}
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    job, wait = self._next_job(now)
+                    if job:
+                        break
+                    # Nothing queued, or everything is waiting on a token bucket
+                    self._cond.wait(timeout=wait)
+                self._dispatched(job, now)
+                self._busy += 1
+
+            try:
+                job.fn(*job.args)
+            except Exception as e:
+                print(f"Job {getattr(job.fn, '__name__', job.fn)} failed: {e}")
+            finally:
+                with self._cond:
+                    self._busy -= 1
+
+
+class AsyncJobScheduler(JobScheduler):
+    """JobScheduler for coroutines: up to `workers` jobs run at once as tasks on the event loop.
+
+    Queuing, fairness and rate limits are the same as JobScheduler's; fn must
+    be a coroutine function. Call start() from inside the running loop.
+    """
+
+    def _condition(self):
+        return nullcontext()  # everything runs on the loop thread
+
+    def _start_workers(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = set()
+
+    def _ensure_workers(self):
+        pass  # start() runs the dispatcher
+
+    def _wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        task = asyncio.get_running_loop().create_task(self._dispatcher(), name=self.name)
+        self._tasks.add(task)
+
+    async def _dispatcher(self):
+        while True:
+            wait = None
+            while self._busy < self.workers:
+                now = time.monotonic()
+                job, wait = self._next_job(now)
+                if not job:
+                    break
+                self._dispatched(job, now)
+                self._busy += 1
+                task = asyncio.create_task(self._run(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            # Sleep until a job is queued or finishes, or a token bucket refills
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: _Job):
+        try:
+            await job.fn(*job.args)
+        except Exception as e:
+            print(f"Job {getattr(job.fn, '__name__', job.fn)} failed: {e}")
+        finally:
+            self._busy -= 1
+            self._wake()
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+# Order of a job's stages. A job is finished once it reaches "uploaded" or "closed"
+# (answered some other way: a chat reply, an error message).
+STAGES = ("accepted", "started", "model_done", "uploaded")
+FINISHED = ("uploaded", "closed")
+
+
+class JobJournal:
+    """Append-only log of where each edit job got to, so jobs survive a restart.
+
+    Records are JSON lines {"id", "state", "time", ...}, written and fsynced
+    by a background thread in batches - one fsync covers everything recorded
+    in the last `flush_interval`. record(wait=True) blocks until its batch is
+    on disk. A model result is saved to its own file before its "model_done"
+    record, so a resumed job can go straight to uploading. A "resumed" record
+    counts the restarts a job has been through, so one that keeps taking the
+    process down can be given up on. Once the log holds mostly finished jobs,
+    it's rewritten with just the unfinished ones. Nothing is read, written or
+    started until the journal is first used.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 0.02, compact_every: int = 1000):
+        self.directory = directory
+        self.path = os.path.join(directory, "journal.log")
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self._jobs = {}  # job id -> {"state", "job", "result", ...} for unfinished jobs
+        self._pending = []  # (record, blob) waiting to be written
+        self._lines = 0  # records in the log file
+        self._written = 0  # batches on disk
+        self._taken = 0  # batches the flusher has taken, written or not
+        self._queued = 0  # batches someone is waiting for
+        self._cond = threading.Condition()
+        self._file = None  # opened on first use
+        atexit.register(self.flush)
+
+    def record(self, job_id: str, state: str, wait: bool = False, **data):
+        """Note that a job reached `state`, with any extra fields to remember. Stages never go backwards."""
+        self._add({"id": job_id, "state": state, "time": round(time.time(), 3), **data}, None, wait)
+
+    def record_result(self, job_id: str, image_data: bytes, text: str | None, mime_type: str | None):
+        """Save a model result and mark the job model_done, so a restart only has to upload it."""
+        self._add({"id": job_id, "state": "model_done", "time": round(time.time(), 3), "text": text, "mime_type": mime_type}, image_data, False)
+
+    def unfinished(self) -> list[dict]:
+        """Jobs that were accepted but never finished, oldest first, each with its "journal" state."""
+        with self._cond:
+            self._open()
+            entries = sorted(self._jobs.values(), key=lambda e: e["accepted_at"])
+            return [dict(e["job"], journal={k: v for k, v in e.items() if k != "job"}) for e in entries if "job" in e]
+
+    def result(self, job_id: str) -> tuple[bytes, str | None, str | None] | None:
+        """The saved model result for a job, as (image_data, text, mime_type), if there is one."""
+        with self._cond:
+            self._open()
+            entry = self._jobs.get(job_id)
+            if not entry or entry["state"] != "model_done":
+                return None
+            text, mime_type = entry.get("text"), entry.get("mime_type")
+        try:
+            with open(self._result_path(job_id), "rb") as f:
+                return f.read(), text, mime_type
+        except OSError:
+            return None
+
+    def flush(self):
+        """Block until everything recorded so far is on disk, including a batch the flusher is partway through."""
+        with self._cond:
+            if self._file is not None:
+                self._wait_for_batch(new=bool(self._pending))
+
+    def _open(self):
+        """Replay the log and start the flusher, the first time through. Call holding _cond."""
+        if self._file is not None:
+            return
+        os.makedirs(os.path.join(self.directory, "results"), exist_ok=True)
+        self._load()
+        self._file = open(self.path, "a")
+        threading.Thread(target=self._flush_loop, name="banana-journal", daemon=True).start()
+
+    def _result_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, "results", job_id)
+
+    def _add(self, record: dict, blob: bytes | None, wait: bool):
+        with self._cond:
+            self._open()
+            if not self._apply(record):
+                return
+            self._pending.append((record, blob))
+            self._cond.notify_all()
+            if wait:
+                self._wait_for_batch(new=True)
+
+    def _wait_for_batch(self, new: bool):
+        """Wait until the batches taken so far (and, if `new`, the pending records) are written. Call holding _cond."""
+        if new:
+            self._queued = max(self._queued, self._taken) + 1
+        target = max(self._queued, self._taken)
+        self._cond.notify_all()
+        while self._written < target:
+            self._cond.wait()
+
+    def _apply(self, record: dict) -> bool:
+        """Fold a record into the in-memory state. Returns False if it's stale."""
+        job_id, state = record["id"], record["state"]
+        entry = self._jobs.get(job_id)
+        if state == "accepted":
+            if entry is None:
+                # A compacted record carries the rest of the job's state too
+                self._jobs[job_id] = {"accepted_at": record["time"], **{k: v for k, v in record.items() if k not in ("id", "time")}}
+            return True
+        if entry is None:
+            return False  # already finished, or never accepted
+        if state in FINISHED:
+            del self._jobs[job_id]
+            return True
+        if state == "resumed":
+            entry["resumed"] = entry.get("resumed", 0) + 1
+            return True
+        if STAGES.index(state) < STAGES.index(entry["state"]):
+            return False
+        entry.update({k: v for k, v in record.items() if k not in ("id", "time")})
+        return True
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queued > self._taken or self._pending)
+                # Nobody is waiting on this batch - give it a moment to collect more records
+                if self._queued <= self._taken:
+                    self._cond.wait_for(lambda: self._queued > self._taken, timeout=self.flush_interval)
+                batch, self._pending = self._pending, []
+                target = self._taken = max(self._queued, self._taken + 1)
+
+            try:
+                self._write(batch)
+            except OSError as e:
+                print(f"Error writing job journal: {e}")
+
+            with self._cond:
+                self._written = target
+                self._cond.notify_all()
+
+            if self._lines > self.compact_every and self._lines > 4 * len(self._jobs):
+                self._compact()
+
+    def _write(self, batch: list):
+        for record, blob in batch:
+            if blob is not None:
+                # The result has to be durable before the record that points at it
+                with open(self._result_path(record["id"]), "wb") as f:
+                    f.write(blob)
+                    f.flush()
+                    os.fsync(f.fileno())
+        for record, _ in batch:
+            self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._lines += len(batch)
+
+        for record, _ in batch:
+            if record["state"] in FINISHED:
+                try:
+                    os.remove(self._result_path(record["id"]))
+                except FileNotFoundError:
+                    pass
+
+    def _compact(self):
+        """Rewrite the log with one merged record per unfinished job."""
+        with self._cond:
+            snapshot = [{"id": job_id, "time": entry["accepted_at"], **entry} for job_id, entry in self._jobs.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                for entry in snapshot:
+                    record = {k: v for k, v in entry.items() if k != "accepted_at"}
+                    f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            with self._cond:
+                # Records made since the snapshot are still in _pending and go to the new file
+                os.replace(tmp_path, self.path)
+                self._file.close()
+                self._file = open(self.path, "a")
+                self._lines = len(snapshot)
+        except OSError as e:
+            print(f"Error compacting job journal: {e}")
+
+    def _load(self):
+        try:
+            f = open(self.path)
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a torn last line from a crash
+                self._lines += 1
+                if "job" in record and record["state"] != "accepted":
+                    # A compacted record: accepted, then moved on to its stage
+                    self._apply({"id": record["id"], "state": "accepted", "time": record["time"], "job": record["job"]})
+                self._apply(record)
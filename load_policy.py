@@ -0,0 +1,40 @@
+import threading
+
+
+class LoadPolicy:
+    """Decides when the bot is busy enough to cut corners on new work.
+
+    `depth` and `latency` are callables for the current queue depth and recent
+    Gemini latency (None when there's nothing to go on). Pressure starts when
+    either reaches its threshold (0 turns that check off) and lasts until both
+    are back under `recovery` times their thresholds, so it doesn't flap.
+    """
+
+    def __init__(self, depth, latency, max_depth: int = 0, max_latency: float = 0.0, recovery: float = 0.7):
+        self.depth = depth
+        self.latency = latency
+        self.max_depth = max_depth
+        self.max_latency = max_latency
+        self.recovery = recovery
+        self.reason = None  # why we're under pressure, or None
+        self._lock = threading.Lock()
+
+    def pressure(self) -> str | None:
+        """"queue" or "latency" while under pressure, else None."""
+        if not self.max_depth and not self.max_latency:
+            return None
+        depth, latency = self.depth(), self.latency()
+        with self._lock:
+            scale = self.recovery if self.reason else 1.0
+            reason = None
+            if self.max_depth and depth >= self.max_depth * scale:
+                reason = "queue"
+            elif self.max_latency and latency is not None and latency >= self.max_latency * scale:
+                reason = "latency"
+
+            if reason and not self.reason:
+                print(f"Under load ({depth} queued, Gemini latency {latency or 0:.1f}s) - degrading new work")
+            elif self.reason and not reason:
+                print("Load back to normal")
+            self.reason = reason
+            return reason
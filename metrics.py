@@ -0,0 +1,152 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets for stage timings, in seconds
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _label_str(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), chr(39))}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Counters, gauges and stage timers, exported in Prometheus text format and to a JSONL log."""
+
+    def __init__(self, log_path: str | None = None):
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._gauges = {}  # (name, labels) -> fn returning the current value
+        self._gauge_sets = {}  # name -> fn returning [(labels, value), ...]
+        self._help = {}
+        self._lock = threading.Lock()
+        self._log = open(log_path, "a") if log_path else None
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def gauge(self, name: str, fn, **labels):
+        """Register a gauge whose value is read from fn() at scrape time."""
+        self._gauges[(name, tuple(sorted(labels.items())))] = fn
+
+    def gauge_set(self, name: str, fn):
+        """Register a gauge whose label sets aren't known up front: fn() returns [(labels, value), ...] at scrape time."""
+        self._gauge_sets[name] = fn
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Time a pipeline stage into banana_stage_seconds, tagged with whether it raised."""
+        started = time.monotonic()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            labels = {k: v for k, v in labels.items() if v is not None}
+            self.observe("banana_stage_seconds", elapsed, stage=stage, outcome=outcome, **labels)
+            self.log({"stage": stage, "seconds": round(elapsed, 4), "outcome": outcome, **labels})
+
+    def log(self, record: dict):
+        """Append a record to the JSONL log, if there is one."""
+        if not self._log:
+            return
+        line = json.dumps({"time": round(time.time(), 3), **record})
+        with self._lock:
+            try:
+                self._log.write(line + "\n")
+                self._log.flush()
+            except OSError as e:
+                print(f"Error writing metrics log: {e}")
+
+    def render(self) -> str:
+        """Everything in Prometheus text exposition format."""
+        lines = []
+        typed = set()
+
+        def header(name: str, kind: str):
+            if name in typed:
+                return
+            typed.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_label_str(labels)} {value}")
+
+        for (name, labels), hist in histograms:
+            header(name, "histogram")
+            for bound, count in zip(BUCKETS, hist):
+                lines.append(f"{name}_bucket{_label_str(labels + (('le', bound),))} {count}")
+            lines.append(f"{name}_bucket{_label_str(labels + (('le', '+Inf'),))} {hist[-1]}")
+            lines.append(f"{name}_sum{_label_str(labels)} {hist[-2]}")
+            lines.append(f"{name}_count{_label_str(labels)} {hist[-1]}")
+
+        for (name, labels), fn in sorted(self._gauges.items(), key=lambda item: item[0]):
+            header(name, "gauge")
+            try:
+                lines.append(f"{name}{_label_str(labels)} {fn()}")
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+
+        for name, fn in sorted(self._gauge_sets.items()):
+            header(name, "gauge")
+            try:
+                for labels, value in fn():
+                    lines.append(f"{name}{_label_str(tuple(sorted(labels.items())))} {value}")
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve /metrics on a background thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # don't print every scrape
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="banana-metrics", daemon=True).start()
+        return server
@@ -0,0 +1,72 @@
+import io
+from PIL import Image, ImageOps
+
+# Longest edge Gemini produces for each output resolution - no point sending more
+TARGET_EDGE = {"1K": 1024, "2K": 2048, "4K": 4096}
+
+# Formats that are already compact enough that we only re-encode them when shrinking
+COMPACT_TYPES = {"image/jpeg", "image/webp"}
+
+
+def target_size(width: int, height: int, resolution: str, aspect_ratio: str | None) -> tuple[int, int]:
+    """Smallest size that still covers the requested output, never larger than the original."""
+    edge = TARGET_EDGE.get(resolution, 2048)
+
+    if aspect_ratio:
+        # Output box for the ratio, e.g. 16:9 at 2K -> 2048x1152. Cover it so no detail is lost.
+        rw, rh = (int(n) for n in aspect_ratio.split(":"))
+        box_w, box_h = (edge, edge * rh / rw) if rw >= rh else (edge * rw / rh, edge)
+        scale = max(box_w / width, box_h / height)
+    else:
+        scale = edge / max(width, height)
+
+    if scale >= 1:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def normalize_image(data: bytes, mime_type: str, resolution: str = "2K", aspect_ratio: str | None = None, quality: int = 90) -> tuple[bytes, str]:
+    """Downscale an input image to what the output needs, drop metadata and re-encode compactly.
+
+    Returns the original (data, mime_type) whenever that would be smaller or it can't be decoded.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))  # lazy - only reads the header
+
+        # Phone photos are often stored sideways with an EXIF rotation tag
+        orientation = image.getexif().get(0x0112, 1)
+        rotated = orientation in (5, 6, 7, 8)
+        width, height = (image.height, image.width) if rotated else image.size
+        size = target_size(width, height, resolution, aspect_ratio)
+
+        if size == (width, height) and mime_type in COMPACT_TYPES:
+            return data, mime_type
+
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, which is much faster than full decode + resize
+        image.draft("RGB", size[::-1] if rotated else size)
+        image = ImageOps.exif_transpose(image)
+        if image.size != size:
+            image = image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        out = io.BytesIO()
+        if has_alpha:
+            image.convert("RGBA").save(out, format="WEBP", quality=quality, method=4)
+            new_type = "image/webp"
+        else:
+            image.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+            new_type = "image/jpeg"
+    except Exception as e:
+        print(f"Couldn't preprocess {mime_type} image: {e}")
+        return data, mime_type
+
+    if out.tell() >= len(data):
+        return data, mime_type
+    return out.getvalue(), new_type
+
+
+def normalize_images(images: list[tuple[bytes, str]], resolution: str = "2K", aspect_ratio: str | None = None, quality: int = 90) -> tuple[list[tuple[bytes, str]], int]:
+    """Normalize every input image. Returns (images, bytes_saved)."""
+    normalized = [normalize_image(data, mime_type, resolution, aspect_ratio, quality) for data, mime_type in images]
+    saved = sum(len(data) for data, _ in images) - sum(len(data) for data, _ in normalized)
+    return normalized, saved
@@ -0,0 +1,157 @@
+import time
+import asyncio
+import threading
+
+# Don't update the message more often than this (seconds), except on stage changes
+MIN_UPDATE_INTERVAL = 1.0
+
+
+class ProgressMessage:
+    """Keeps the acknowledgment message up to date while an edit runs.
+
+    The message shows the current stage, the elapsed time (refreshed every
+    `interval` seconds by a background ticker) and any text the model has
+    streamed so far. When the model's image arrives, `on_image` is called
+    straight away to start its upload in the background and return a Future -
+    the stream (and the Gemini call around it) doesn't wait for the upload.
+    """
+
+    def __init__(self, client, channel_id: str, ts: str, header: str, interval: float = 3.0, on_image=None):
+        self.client = client
+        self.channel_id = channel_id
+        self.ts = ts
+        self.header = header
+        self.interval = interval
+        self.on_image = on_image
+        self.upload = None  # the streamed image's upload, once started
+        self._stage = "Starting"
+        self._text = ""
+        self._started = time.monotonic()
+        self._rendered = None
+        self._updated_at = 0.0
+        self._start_ticker()
+
+    def _start_ticker(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._tick, name="banana-progress", daemon=True).start()
+
+    def stage(self, name: str):
+        if name != self._stage:
+            self._stage = name
+            self._update(force=True)
+
+    def text(self, chunk: str):
+        self._text += chunk
+        self._update()
+
+    def restart(self):
+        """Another attempt at the stream is starting, so drop the text from the last one.
+
+        Plain method in both classes - the next update shows the change."""
+        self._text = ""
+
+    def image(self, data: bytes, mime_type: str | None, text: str | None):
+        """The model's image part is complete - hand it off for upload."""
+        if self.on_image and self.upload is None:
+            self.stage("Uploading")
+            self.upload = self.on_image(data, mime_type, text)
+
+    def uploaded(self) -> bool:
+        """Wait for the streamed image's upload. False if there wasn't one or it failed."""
+        if self.upload is None:
+            return False
+        try:
+            self.upload.result()
+            return True
+        except Exception as e:
+            # Leave it to the job to upload it again
+            print(f"Error uploading streamed image: {e}")
+            return False
+
+    def finish(self, stage: str = "Done"):
+        self._done.set()
+        self._stage = stage
+        self._update(force=True)
+
+    def _render(self) -> str:
+        elapsed = time.monotonic() - self._started
+        text = f"{self.header}\n_{self._stage} · {elapsed:.0f}s_"
+        if self._text:
+            text += f"\n\n{self._text}"
+        return text
+
+    def _update(self, force: bool = False):
+        with self._lock:
+            # Text can stream in faster than chat.update's rate limit - the ticker catches up
+            if not force and time.monotonic() - self._updated_at < MIN_UPDATE_INTERVAL:
+                return
+            rendered = self._render()
+            if rendered == self._rendered:
+                return
+            try:
+                self.client.chat_update(channel=self.channel_id, ts=self.ts, text=rendered)
+                self._rendered = rendered
+                self._updated_at = time.monotonic()
+            except Exception as e:
+                print(f"Error updating progress: {e}")
+
+    def _tick(self):
+        while not self._done.wait(self.interval):
+            self._update()
+
+
+class AsyncProgressMessage(ProgressMessage):
+    """ProgressMessage for an async Slack client. Methods are coroutines and on_image returns a Task."""
+
+    def _start_ticker(self):
+        self._lock = asyncio.Lock()
+        self._ticker = asyncio.get_running_loop().create_task(self._tick())
+
+    async def stage(self, name: str):
+        if name != self._stage:
+            self._stage = name
+            await self._update(force=True)
+
+    async def text(self, chunk: str):
+        self._text += chunk
+        await self._update()
+
+    async def image(self, data: bytes, mime_type: str | None, text: str | None):
+        if self.on_image and self.upload is None:
+            await self.stage("Uploading")
+            self.upload = self.on_image(data, mime_type, text)
+
+    async def uploaded(self) -> bool:
+        if self.upload is None:
+            return False
+        try:
+            await self.upload
+            return True
+        except Exception as e:
+            print(f"Error uploading streamed image: {e}")
+            return False
+
+    async def finish(self, stage: str = "Done"):
+        self._ticker.cancel()
+        self._stage = stage
+        await self._update(force=True)
+
+    async def _update(self, force: bool = False):
+        async with self._lock:
+            if not force and time.monotonic() - self._updated_at < MIN_UPDATE_INTERVAL:
+                return
+            rendered = self._render()
+            if rendered == self._rendered:
+                return
+            try:
+                await self.client.chat_update(channel=self.channel_id, ts=self.ts, text=rendered)
+                self._rendered = rendered
+                self._updated_at = time.monotonic()
+            except Exception as e:
+                print(f"Error updating progress: {e}")
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._update()
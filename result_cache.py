@@ -0,0 +1,62 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase and collapse whitespace so trivially different prompts share a key."""
+    return " ".join(prompt.lower().split())
+
+
+def result_key(images: list[tuple[bytes, str]], prompt: str, resolution: str, aspect_ratio: str | None) -> str:
+    """Key for an edit: content hashes of the inputs plus the normalized prompt and options."""
+    h = hashlib.sha256()
+    for data, _ in images:
+        h.update(hashlib.sha256(data).digest())
+    h.update(f"\0{normalize_prompt(prompt)}\0{resolution}\0{aspect_ratio or ''}".encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Edit results (image_data, text_response, mime_type) kept for ttl seconds, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[bytes, str | None, str | None] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: str, result: tuple[bytes, str | None, str | None]):
+        size = len(result[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self.size += size
+
+            # Drop expired entries first, then least recently used
+            now = time.monotonic()
+            for old_key in [k for k, (expires_at, _) in self._entries.items() if expires_at < now]:
+                self._remove(old_key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1][0])
@@ -0,0 +1,64 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class EditSessions:
+    """Each thread's recent edits as Gemini conversation history, so a follow-up only has to send its prompt.
+
+    A session belongs to the image it last produced: it's only handed out while
+    that's still the thread's latest image. History is whatever the caller
+    stores (Gemini Content objects, images as Files API references), kept to
+    the last `max_turns` edits. Sessions expire after `ttl` seconds idle - keep
+    that well inside the 48 hours Gemini keeps uploaded files - and the least
+    recently used go once there are more than `max_sessions`.
+    """
+
+    def __init__(self, max_sessions: int = 500, max_turns: int = 6, ttl: float = 6 * 3600):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # "channel:thread" -> {"history", "image_url", "expires_at"}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, channel_id: str, thread_ts: str, image_url: str) -> list | None:
+        """History to continue from, if the thread's latest image is still the one its session produced."""
+        key = f"{channel_id}:{thread_ts}"
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            if session["expires_at"] < time.monotonic():
+                del self._sessions[key]
+                return None
+            if session["image_url"] != image_url:
+                return None
+            self._sessions.move_to_end(key)
+            return list(session["history"])
+
+    def start(self, channel_id: str, thread_ts: str, user, model, image_url: str):
+        """Begin (or restart) a thread's session with one edit."""
+        with self._lock:
+            self._put(f"{channel_id}:{thread_ts}", [user, model], image_url)
+
+    def extend(self, channel_id: str, thread_ts: str, user, model, image_url: str):
+        """Add an edit to a thread's session, dropping the oldest beyond max_turns."""
+        key = f"{channel_id}:{thread_ts}"
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return  # evicted meanwhile - the next follow-up starts over
+            self._put(key, (session["history"] + [user, model])[-2 * self.max_turns:], image_url)
+
+    def drop(self, channel_id: str, thread_ts: str):
+        with self._lock:
+            self._sessions.pop(f"{channel_id}:{thread_ts}", None)
+
+    def _put(self, key: str, history: list, image_url: str):
+        self._sessions.pop(key, None)
+        self._sessions[key] = {"history": history, "image_url": image_url, "expires_at": time.monotonic() + self.ttl}
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
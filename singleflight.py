@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one call whose result they all share."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, *args, **kwargs):
+        """Run fn unless a call with this key is already running, in which case wait for it.
+
+        Returns (result, shared), where shared is True if the result came from another caller's call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop."""
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key: str, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs) unless a call with this key is already running. Returns (result, shared)."""
+        call = self._calls.get(key)
+        if call is not None:
+            # shield: one waiter giving up mustn't cancel the call for everyone else
+            return await asyncio.shield(call), True
+
+        call = self._calls[key] = asyncio.ensure_future(fn(*args, **kwargs))
+        try:
+            return await asyncio.shield(call), False
+        finally:
+            if call.done():
+                del self._calls[key]
+            else:
+                call.add_done_callback(lambda _: self._calls.pop(key, None))
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The bot's modules sit at the repo root rather than in a package, so make them importable
+# however pytest is started (`pytest`, `python -m pytest`, from the root or from tests/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+import time
+
+from dedup import EventDedup
+
+
+def test_redelivered_event_is_a_duplicate():
+    dedup = EventDedup()
+
+    assert dedup.check_and_add(["Ev1", "m1"]) is False
+    assert dedup.check_and_add(["Ev1"]) is True
+    assert dedup.check_and_add(["Ev2", "m1"]) is True  # same message, new event ID
+    assert dedup.check_and_add(["Ev3", "m3"]) is False
+
+
+def test_empty_keys_are_ignored():
+    dedup = EventDedup()
+    dedup.check_and_add(["Ev1", None, ""])
+
+    assert dedup.check_and_add(["Ev2", ""]) is False
+
+
+def test_keys_expire_after_the_window():
+    dedup = EventDedup(window=0.1)
+    dedup.check_and_add(["Ev1"])
+    time.sleep(0.2)
+
+    assert dedup.check_and_add(["Ev1"]) is False
+
+
+def test_oldest_keys_go_first_when_full():
+    dedup = EventDedup(max_entries=2)
+    for key in ("Ev1", "Ev2", "Ev3"):
+        dedup.check_and_add([key])
+
+    assert dedup.check_and_add(["Ev3"]) is True
+    assert dedup.check_and_add(["Ev1"]) is False
+
+
+def test_keys_survive_a_restart(tmp_path):
+    path = str(tmp_path / "dedup" / "events.log")
+    EventDedup(path=path).check_and_add(["Ev1", "m1"])
+
+    restarted = EventDedup(path=path)
+
+    assert restarted.check_and_add(["Ev1"]) is True
+    assert restarted.check_and_add(["Ev2", "m1"]) is True
+
+
+def test_expired_and_torn_lines_are_dropped_on_reload(tmp_path):
+    path = tmp_path / "events.log"
+    now = time.time()
+    path.write_text(f"{now - 3600:.3f}\tEv-old\n{now:.3f}\tEv-new\n{now:.3f}\tEv-torn\nnot-a-ti")
+
+    dedup = EventDedup(window=600, path=str(path))
+
+    assert dedup.check_and_add(["Ev-old"]) is False
+    assert dedup.check_and_add(["Ev-new"]) is True
+    # Reloading rewrote the log with only live keys, plus what's been added since
+    assert [line.split("\t")[1] for line in path.read_text().splitlines()] == ["Ev-new", "Ev-torn", "Ev-old"]
+
+
+def test_log_is_compacted_as_it_grows(tmp_path):
+    path = tmp_path / "events.log"
+    dedup = EventDedup(max_entries=5, path=str(path))
+    for i in range(30):
+        dedup.check_and_add([f"Ev{i}"])
+
+    assert len(path.read_text().splitlines()) <= 2 * 5 + 1
+    assert EventDedup(path=str(path)).check_and_add(["Ev29"]) is True
@@ -0,0 +1,138 @@
+import asyncio
+
+import httpx
+import pytest
+from google.genai import errors
+
+from gemini_control import AdaptiveLimiter, AsyncAdaptiveLimiter, async_call_with_retry, call_with_retry, is_overload, is_retryable
+
+
+def api_error(code: int) -> errors.APIError:
+    return errors.APIError(code, {"error": {"code": code, "message": "", "status": ""}})
+
+
+def call(limiter: AdaptiveLimiter, latency: float | None, overloaded: bool = False):
+    assert limiter.acquire(1)
+    limiter.release(latency, overloaded=overloaded)
+
+
+def test_slow_start_adds_a_slot_per_success():
+    limiter = AdaptiveLimiter("test", initial=2, max_limit=16)
+
+    for _ in range(4):
+        call(limiter, 1.0)
+
+    assert limiter.limit == 6
+
+
+def test_overload_halves_the_cap_and_ends_slow_start():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=16, cooldown=0)
+    call(limiter, 1.0, overloaded=True)
+    assert limiter.limit == 4
+
+    call(limiter, 1.0)
+    assert limiter.limit == pytest.approx(4.25)  # one slot per round trip of four calls
+
+
+def test_slow_calls_halve_the_cap():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=16, latency_tolerance=2.0, cooldown=0)
+    call(limiter, 1.0)
+    while limiter.avg_latency <= 2.0:
+        call(limiter, 10.0)
+
+    assert limiter.limit == 4.5
+
+
+def test_back_off_once_per_cooldown():
+    limiter = AdaptiveLimiter("test", initial=8, cooldown=60)
+    for _ in range(3):
+        call(limiter, None, overloaded=True)
+
+    assert limiter.limit == 4
+
+
+def test_cap_stays_within_bounds():
+    limiter = AdaptiveLimiter("test", initial=2, min_limit=1, max_limit=3, cooldown=0)
+    for _ in range(5):
+        call(limiter, 1.0)
+    assert limiter.limit == 3
+
+    for _ in range(5):
+        call(limiter, None, overloaded=True)
+    assert limiter.limit == 1
+
+
+def test_acquire_waits_for_a_free_slot():
+    limiter = AdaptiveLimiter("test", initial=1)
+    assert limiter.acquire(1)
+    assert not limiter.acquire(0.05)
+
+    limiter.release(1.0)
+    assert limiter.acquire(0.05)
+
+
+@pytest.mark.parametrize("error, retryable, overload", [
+    (api_error(429), True, True),
+    (api_error(503), True, True),
+    (api_error(500), True, False),
+    (api_error(400), False, False),
+    (httpx.ReadTimeout("slow"), True, True),
+    (httpx.ConnectError("refused"), True, False),
+    (asyncio.TimeoutError(), True, True),
+    (ValueError("bad image"), False, False),
+])
+def test_error_classification(error, retryable, overload):
+    assert is_retryable(error) is retryable
+    assert is_overload(error) is overload
+
+
+def test_transient_errors_are_retried():
+    limiter = AdaptiveLimiter("test", cooldown=0)
+    failures = [api_error(503), api_error(500)]
+
+    def fn(timeout):
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    assert call_with_retry(fn, limiter, deadline=5, base_delay=0.01) == "ok"
+    assert limiter.in_flight == 0
+
+
+def test_other_errors_are_not_retried():
+    limiter = AdaptiveLimiter("test")
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        raise api_error(400)
+
+    with pytest.raises(errors.APIError):
+        call_with_retry(fn, limiter, deadline=5, base_delay=0.01)
+    assert len(calls) == 1
+
+
+def test_failed_attempts_dont_lower_the_latency_baseline():
+    limiter = AdaptiveLimiter("test")
+    call(limiter, 2.0)
+
+    def fn(timeout):
+        raise api_error(400)  # fails instantly
+
+    with pytest.raises(errors.APIError):
+        call_with_retry(fn, limiter, deadline=5)
+    assert limiter.best_latency == limiter.avg_latency == 2.0
+
+
+def test_async_retries_share_the_limiter_logic():
+    limiter = AsyncAdaptiveLimiter("test", cooldown=0)
+    failures = [api_error(500)]
+
+    async def fn(timeout):
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+
+    assert asyncio.run(async_call_with_retry(fn, limiter, deadline=5, base_delay=0.01)) == "ok"
+    assert limiter.in_flight == 0
+    assert limiter.best_latency < 1
@@ -0,0 +1,57 @@
+import os
+import time
+
+from image_cache import DiskCache
+
+
+def test_nothing_is_touched_until_first_write(tmp_path):
+    directory = tmp_path / "images"
+    cache = DiskCache(str(directory), max_bytes=100)
+
+    assert cache.get("F1") is None
+    assert not directory.exists()
+
+    cache.put("F1", b"x" * 10)
+    assert cache.get("F1") == b"x" * 10
+
+
+def test_processes_sharing_a_directory_keep_to_one_budget(tmp_path):
+    first, second = DiskCache(str(tmp_path), max_bytes=100), DiskCache(str(tmp_path), max_bytes=100)
+
+    for i in range(10):
+        (first if i % 2 else second).put(f"F{i}", b"x" * 20)
+        time.sleep(0.01)  # distinct mtimes
+
+    assert sum(f.stat().st_size for f in tmp_path.iterdir()) <= 100
+    assert first.get("F9") == b"x" * 20
+    assert second.get("F0") is None
+
+
+def test_reads_from_another_process_keep_a_file(tmp_path):
+    writer, reader = DiskCache(str(tmp_path), max_bytes=100), DiskCache(str(tmp_path), max_bytes=100)
+    writer.put("F0", b"x" * 40)
+    time.sleep(0.01)
+    writer.put("F1", b"x" * 40)
+    time.sleep(0.01)
+
+    assert reader.get("F0") == b"x" * 40  # the reader never wrote it, but it's a hit
+    time.sleep(0.01)
+    writer.put("F2", b"x" * 40)
+
+    assert writer.get("F0") is not None
+    assert writer.get("F1") is None
+
+
+def test_only_own_temp_files_are_cleaned_up(tmp_path):
+    mine = tmp_path / f"F1.{os.getpid()}.1.tmp"
+    theirs = tmp_path / f"F2.{os.getpid() + 1}.1.tmp"
+    abandoned = tmp_path / f"F3.{os.getpid() + 1}.1.tmp"
+    for path in (mine, theirs, abandoned):
+        path.write_bytes(b"partial")
+    os.utime(abandoned, (time.time() - 7200, time.time() - 7200))
+
+    DiskCache(str(tmp_path), max_bytes=100).put("F4", b"x")
+
+    assert not mine.exists()
+    assert theirs.exists()
+    assert not abandoned.exists()
@@ -0,0 +1,63 @@
+from intents import GREETING_REPLIES, HELP_REPLY, THANKS_REPLIES, ReplyCache, local_reply, normalize_message
+
+
+def test_normalize_drops_mentions_punctuation_and_emoji():
+    assert normalize_message("<@U0123> Hey there!! :wave: 🍌") == "hey there"
+    assert normalize_message("What's   up?") == "whats up"
+
+
+def test_normalize_keeps_letters_in_any_script():
+    assert normalize_message("Привет, что ты умеешь?") == "привет что ты умеешь"
+    assert normalize_message("こんにちは！") == "こんにちは"
+    assert normalize_message("STRASSE Straße") == "strasse strasse"
+
+
+def test_greetings_thanks_and_help_get_templates():
+    assert local_reply("hi") in GREETING_REPLIES
+    assert local_reply("Good morning, banana bot!") in GREETING_REPLIES
+    assert local_reply("thanks so much 🙏") in THANKS_REPLIES
+    assert local_reply("how does this work?") == HELP_REPLY
+
+
+def test_empty_mention_gets_a_greeting():
+    assert local_reply("") in GREETING_REPLIES
+    assert local_reply("<@U0123>  ") in GREETING_REPLIES
+
+
+def test_anything_else_goes_to_the_model():
+    assert local_reply("hi can you make this a cat") is None
+    assert local_reply("Привет, что ты умеешь?") is None
+    assert local_reply("こんにちは") is None
+    assert local_reply("🍌🍌🍌") is None
+    assert local_reply("?") is None
+
+
+def test_reply_cache_matches_normalized_messages():
+    cache = ReplyCache()
+    cache.put("What can you edit?", "Photos!")
+
+    assert cache.get("what can you edit") == "Photos!"
+    assert cache.get("what can you do") is None
+
+
+def test_reply_cache_keeps_non_latin_messages_apart():
+    cache = ReplyCache()
+    cache.put("Привет, что ты умеешь?", "Russian reply")
+    cache.put("こんにちは", "Japanese reply")
+    cache.put("🍌", "Banana reply")
+
+    assert cache.get("привет что ты умеешь") == "Russian reply"
+    assert cache.get("こんにちは！") == "Japanese reply"
+    assert cache.get("🍌") == "Banana reply"
+    assert cache.get("🔥") is None
+
+
+def test_reply_cache_evicts_least_recently_used():
+    cache = ReplyCache(max_entries=2)
+    cache.put("one", "1")
+    cache.put("two", "2")
+    cache.get("one")
+    cache.put("three", "3")
+
+    assert cache.get("two") is None
+    assert cache.get("one") == "1"
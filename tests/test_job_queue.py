@@ -0,0 +1,123 @@
+import time
+
+import pytest
+
+from job_queue import SQLiteJobQueue
+from jobs import QueueFull
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "queue.db"), max_queue=10, visibility_timeout=0.2, max_attempts=2)
+
+
+def test_lease_hands_out_each_job_once(queue):
+    queue.put({"n": 1})
+    queue.put({"n": 2})
+
+    first = queue.lease("w1")
+    second = queue.lease("w2")
+
+    assert [first[1], second[1]] == [{"n": 1}, {"n": 2}]
+    assert first[2] == second[2] == 1
+    assert queue.lease("w3") is None
+    assert queue.depth() == 0
+    assert queue.leased() == 2
+
+
+def test_acked_job_is_gone(queue):
+    queue.put({"n": 1})
+    job_id, _, _ = queue.lease("w1")
+    queue.ack(job_id, "w1")
+
+    time.sleep(0.3)
+    assert queue.lease("w1") is None
+    assert queue.leased() == 0
+
+
+def test_expired_lease_makes_the_job_visible_again(queue):
+    queue.put({"n": 1})
+    job_id, _, _ = queue.lease("w1")
+    assert queue.lease("w2") is None
+
+    time.sleep(0.3)  # w1 died without acking
+    leased = queue.lease("w2")
+
+    assert leased == (job_id, {"n": 1}, 2)
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    queue.put({"n": 1})
+    job_id, _, _ = queue.lease("w1")
+
+    for _ in range(3):
+        time.sleep(0.1)
+        queue.heartbeat([job_id], "w1")
+
+    assert queue.lease("w2") is None
+
+
+def test_lost_lease_cant_be_acked_by_the_old_owner(queue):
+    queue.put({"n": 1})
+    job_id, _, _ = queue.lease("w1")
+    time.sleep(0.3)
+    queue.lease("w2")
+
+    queue.ack(job_id, "w1")  # w1 was only slow, and finishes late
+
+    assert queue.leased() == 1
+
+
+def test_job_is_dropped_after_max_attempts(queue):
+    queue.put({"n": 1})
+    queue.lease("w1")
+    time.sleep(0.3)
+    queue.lease("w2")
+    time.sleep(0.3)
+
+    assert queue.lease("w3") is None
+    assert queue.depth() == 0
+
+
+def test_dropped_job_is_handed_to_give_up(queue):
+    queue.put({"channel_id": "C1", "thread_ts": "100.0"})
+    queue.lease("w1")
+    time.sleep(0.3)
+    queue.lease("w2")
+    time.sleep(0.3)
+    queue.put({"n": 2})
+
+    dropped = []
+    leased = queue.lease("w3", give_up=lambda job_id, job, attempts: dropped.append((job, attempts)))
+
+    assert dropped == [({"channel_id": "C1", "thread_ts": "100.0"}, 2)]
+    assert leased[1] == {"n": 2}
+
+
+def test_release_makes_the_job_visible_straight_away(queue):
+    queue.put({"n": 1})
+    job_id, _, _ = queue.lease("w1")
+    queue.release(job_id, "w1")
+
+    assert queue.lease("w2") == (job_id, {"n": 1}, 2)
+
+
+def test_full_queue_rejects_new_jobs(tmp_path):
+    queue = SQLiteJobQueue(str(tmp_path / "queue.db"), max_queue=2)
+    queue.put({})
+    queue.put({})
+
+    with pytest.raises(QueueFull):
+        queue.put({})
+
+
+def test_jobs_are_leased_in_fair_order(queue):
+    for n in range(3):
+        queue.put({"user": "a", "n": n}, user="a", channel="c")
+    queue.put({"user": "b", "n": 0}, user="b", channel="d")
+
+    order = []
+    while (leased := queue.lease("w")) is not None:
+        order.append((leased[1]["user"], leased[1]["n"]))
+
+    assert order[:2] == [("a", 0), ("b", 0)]
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from jobs import JobScheduler, QueueFull
+
+
+def run_in_order(scheduler: JobScheduler, jobs: list[tuple[str, str, float]]) -> list[str]:
+    """Queue (name, user, cost) jobs behind a blocker on a one-worker scheduler, then return the order they ran in."""
+    gate = threading.Event()
+    ran = []
+    scheduler.submit(gate.wait, user="blocker", channel="blocker")
+    for name, user, cost in jobs:
+        scheduler.submit(ran.append, name, user=user, channel=f"C-{user}", cost=cost)
+    gate.set()
+
+    deadline = time.monotonic() + 5
+    while len(ran) < len(jobs) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return ran
+
+
+def test_one_user_backlog_doesnt_hold_up_another_user():
+    scheduler = JobScheduler(workers=1, max_queue=20)
+
+    ran = run_in_order(scheduler, [("a1", "a", 1), ("a2", "a", 1), ("a3", "a", 1), ("b1", "b", 1)])
+
+    assert ran.index("b1") <= 1
+
+
+def test_users_take_turns():
+    scheduler = JobScheduler(workers=1, max_queue=20)
+
+    ran = run_in_order(scheduler, [("a1", "a", 1), ("a2", "a", 1), ("b1", "b", 1), ("b2", "b", 1)])
+
+    assert ran == ["a1", "b1", "a2", "b2"]
+
+
+def test_expensive_jobs_take_a_bigger_share():
+    scheduler = JobScheduler(workers=1, max_queue=20)
+
+    ran = run_in_order(scheduler, [("a-4k", "a", 4), ("a-2k", "a", 1)] + [(f"b{i}", "b", 1) for i in range(4)])
+
+    # a's 4K edit counts as four of b's, so a's next job waits for b to catch up
+    assert ran.index("a-2k") > ran.index("b2")
+
+
+def test_weights_give_a_bigger_share():
+    # A job is paced by the slower of its user and its channel, so weight both
+    scheduler = JobScheduler(workers=1, max_queue=20, weights={"a": 2, "C-a": 2})
+
+    ran = run_in_order(scheduler, [(f"a{i}", "a", 1) for i in range(4)] + [(f"b{i}", "b", 1) for i in range(2)])
+
+    assert ran.index("a3") < ran.index("b1")
+
+
+def test_user_rate_limit_lets_other_users_go_first():
+    scheduler = JobScheduler(workers=1, max_queue=20, user_rate=5, user_burst=1)
+
+    ran = run_in_order(scheduler, [("a1", "a", 1), ("a2", "a", 1), ("b1", "b", 1)])
+
+    assert ran == ["a1", "b1", "a2"]
+
+
+def test_full_queue_rejects_new_jobs():
+    scheduler = JobScheduler(workers=1, max_queue=1)
+    started, gate = threading.Event(), threading.Event()
+
+    def first():
+        started.set()
+        gate.wait()
+
+    scheduler.submit(first)
+    assert started.wait(5)  # the worker has it, so the queue is empty again
+    scheduler.submit(gate.wait)
+
+    with pytest.raises(QueueFull):
+        scheduler.submit(gate.wait)
+    gate.set()
+
+
+def test_no_threads_until_the_first_job():
+    scheduler = JobScheduler(workers=3, name="banana-test-lazy")
+    assert not [t for t in threading.enumerate() if t.name.startswith("banana-test-lazy")]
+
+    scheduler.submit(lambda: None)
+    assert len([t for t in threading.enumerate() if t.name.startswith("banana-test-lazy")]) == 3
+
+
+def test_idle_tenant_stats_are_pruned():
+    scheduler = JobScheduler(workers=1, max_queue=1000)
+    for i in range(300):
+        scheduler.submit(lambda: None, user=f"U{i}", channel="C")
+
+    deadline = time.monotonic() + 5
+    while scheduler.depth() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(scheduler.tenant_stats()) < 300
@@ -0,0 +1,161 @@
+import json
+import time
+
+from journal import JobJournal
+
+
+def reopen(journal: JobJournal) -> JobJournal:
+    """What the next process sees: everything flushed, then the log replayed from disk."""
+    journal.flush()
+    return JobJournal(journal.directory)
+
+
+def test_unfinished_jobs_are_replayed(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("a", "accepted", wait=True, job={"prompt": "make it blue"})
+    journal.record("a", "started", ack_ts="100.1")
+    journal.record("b", "accepted", wait=True, job={"prompt": "make it red"})
+
+    unfinished = reopen(journal).unfinished()
+
+    assert [job["prompt"] for job in unfinished] == ["make it blue", "make it red"]
+    assert unfinished[0]["journal"]["state"] == "started"
+    assert unfinished[0]["journal"]["ack_ts"] == "100.1"
+    assert unfinished[1]["journal"]["state"] == "accepted"
+
+
+def test_finished_jobs_are_not_replayed(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("a", "accepted", wait=True, job={})
+    journal.record("a", "uploaded")
+    journal.record("b", "accepted", wait=True, job={})
+    journal.record("b", "closed")
+
+    assert reopen(journal).unfinished() == []
+
+
+def test_saved_result_survives_a_restart_until_the_job_finishes(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("a", "accepted", wait=True, job={})
+    journal.record_result("a", b"png bytes", "Here you go", "image/png")
+
+    journal = reopen(journal)
+    assert journal.result("a") == (b"png bytes", "Here you go", "image/png")
+
+    journal.record("a", "uploaded")
+    journal.flush()
+    assert journal.result("a") is None
+    assert not (tmp_path / "results" / "a").exists()
+
+
+def test_stages_never_go_backwards(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("a", "accepted", wait=True, job={})
+    journal.record_result("a", b"png bytes", None, "image/png")
+    journal.record("a", "started")
+
+    assert reopen(journal).unfinished()[0]["journal"]["state"] == "model_done"
+
+
+def test_records_for_unknown_jobs_are_ignored(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("ghost", "started")
+    journal.record("a", "accepted", wait=True, job={})
+    journal.record("a", "uploaded")
+    journal.record("a", "started")  # a straggler after the job finished
+
+    assert reopen(journal).unfinished() == []
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("a", "accepted", wait=True, job={"prompt": "kept"})
+    journal.flush()
+    with open(journal.path, "a") as f:
+        f.write('{"id": "b", "state": "accep')  # the process died mid-write
+
+    unfinished = JobJournal(str(tmp_path)).unfinished()
+
+    assert [job["prompt"] for job in unfinished] == ["kept"]
+
+
+def test_resumes_are_counted(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("a", "accepted", wait=True, job={})
+    journal.record("a", "resumed", wait=True)
+    journal.record("a", "resumed", wait=True)
+
+    assert reopen(journal).unfinished()[0]["journal"]["resumed"] == 2
+
+
+def test_compaction_keeps_only_unfinished_jobs(tmp_path):
+    journal = JobJournal(str(tmp_path), compact_every=10)
+    journal.record("open", "accepted", wait=True, job={"prompt": "still running"})
+    journal.record("open", "started", ack_ts="100.1")
+    journal.record("open", "resumed", wait=True)
+    journal.record("queued", "accepted", wait=True, job={"prompt": "never started"})
+    journal.record("queued", "resumed", wait=True)
+    for i in range(20):
+        journal.record(f"done{i}", "accepted", job={})
+        journal.record(f"done{i}", "uploaded", wait=True)
+
+    journal.flush()
+
+    # The flusher compacted whenever the log passed compact_every, so only the last few
+    # finished jobs are left of the 45 records written
+    with open(journal.path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) <= 12
+    assert {"open", "queued"} <= {record["id"] for record in records}
+
+    unfinished = reopen(journal).unfinished()
+    assert [job["prompt"] for job in unfinished] == ["still running", "never started"]
+    assert unfinished[0]["journal"]["state"] == "started"
+    assert unfinished[0]["journal"]["ack_ts"] == "100.1"
+    assert unfinished[0]["journal"]["resumed"] == 1
+    # A compacted record still in "accepted" keeps its other fields too
+    assert unfinished[1]["journal"]["state"] == "accepted"
+    assert unfinished[1]["journal"]["resumed"] == 1
+
+
+def test_records_after_compaction_are_replayed(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("a", "accepted", wait=True, job={})
+    journal.record("b", "accepted", wait=True, job={})
+    journal.flush()
+    journal._compact()
+    journal.record("a", "uploaded")
+    journal.record("b", "started")
+
+    unfinished = reopen(journal).unfinished()
+
+    assert [job["journal"]["state"] for job in unfinished] == ["started"]
+
+
+def test_flush_waits_for_a_batch_being_written(tmp_path):
+    journal = JobJournal(str(tmp_path), flush_interval=0)
+    journal.record("warmup", "accepted", wait=True, job={})
+    write = journal._write
+
+    def slow_write(batch):
+        time.sleep(0.2)
+        write(batch)
+
+    journal._write = slow_write
+    journal.record("a", "accepted", job={})
+    while journal._pending:  # the flusher has taken the batch and is writing it
+        time.sleep(0.001)
+    journal.flush()
+
+    with open(journal.path) as f:
+        assert [json.loads(line)["id"] for line in f] == ["warmup", "a"]
+
+
+def test_nothing_is_touched_until_first_use(tmp_path):
+    directory = tmp_path / "journal"
+    journal = JobJournal(str(directory))
+    journal.flush()
+    assert not directory.exists()
+
+    journal.record("a", "accepted", wait=True, job={})
+    assert (directory / "journal.log").exists()
@@ -0,0 +1,51 @@
+from load_policy import LoadPolicy
+
+
+class Load:
+    depth = 0
+    latency = None
+
+
+def make_policy(**kwargs) -> tuple[LoadPolicy, Load]:
+    load = Load()
+    return LoadPolicy(lambda: load.depth, lambda: load.latency, **kwargs), load
+
+
+def test_off_without_thresholds():
+    policy, load = make_policy()
+    load.depth, load.latency = 1000, 1000.0
+
+    assert policy.pressure() is None
+
+
+def test_queue_depth_starts_and_ends_pressure_with_hysteresis():
+    policy, load = make_policy(max_depth=10, recovery=0.7)
+    load.depth = 9
+    assert policy.pressure() is None
+
+    load.depth = 10
+    assert policy.pressure() == "queue"
+
+    load.depth = 8  # under the threshold, but not under 0.7 of it
+    assert policy.pressure() == "queue"
+
+    load.depth = 6
+    assert policy.pressure() is None
+
+    load.depth = 8  # and back up to 8 isn't enough to start it again
+    assert policy.pressure() is None
+
+
+def test_latency_starts_pressure_once_there_is_any():
+    policy, load = make_policy(max_latency=30.0)
+    assert policy.pressure() is None
+
+    load.latency = 35.0
+    assert policy.pressure() == "latency"
+
+    load.latency = 25.0
+    assert policy.pressure() == "latency"
+
+    load.latency = None
+    assert policy.pressure() is None
+
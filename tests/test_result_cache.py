@@ -0,0 +1,70 @@
+import time
+
+from result_cache import ResultCache, result_key
+
+PNG = [(b"input image", "image/png")]
+
+
+def result(size: int) -> tuple[bytes, str | None, str | None]:
+    return b"x" * size, None, "image/png"
+
+
+def test_key_ignores_case_and_spacing_but_not_options():
+    key = result_key(PNG, "Make it  BLUE", "2K", None)
+
+    assert key == result_key(PNG, "make it blue", "2K", None)
+    assert key != result_key(PNG, "make it blue", "4K", None)
+    assert key != result_key(PNG, "make it blue", "2K", "16:9")
+    assert key != result_key([(b"other image", "image/png")], "make it blue", "2K", None)
+
+
+def test_results_expire_after_the_ttl():
+    cache = ResultCache(max_bytes=100, ttl=0.1)
+    cache.put("a", result(10))
+    assert cache.get("a") == result(10)
+
+    time.sleep(0.2)
+
+    assert cache.get("a") is None
+    assert cache.size == 0
+
+
+def test_least_recently_used_results_go_first_when_full():
+    cache = ResultCache(max_bytes=100, ttl=60)
+    cache.put("a", result(40))
+    cache.put("b", result(40))
+    cache.get("a")
+    cache.put("c", result(40))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.size == 80
+
+
+def test_expired_results_are_dropped_before_live_ones():
+    cache = ResultCache(max_bytes=100, ttl=60)
+    cache.put("a", result(40))
+    cache.ttl = 0.1
+    cache.put("short-lived", result(40))
+    time.sleep(0.2)
+    cache.put("b", result(40))
+
+    assert cache.get("a") is not None  # least recently used, but still live
+    assert cache.size == 80
+
+
+def test_oversized_results_are_not_cached():
+    cache = ResultCache(max_bytes=100, ttl=60)
+    cache.put("a", result(40))
+    cache.put("huge", result(101))
+
+    assert cache.get("huge") is None
+    assert cache.get("a") is not None
+
+
+def test_replacing_a_result_keeps_the_size_right():
+    cache = ResultCache(max_bytes=100, ttl=60)
+    cache.put("a", result(40))
+    cache.put("a", result(10))
+
+    assert cache.size == 10
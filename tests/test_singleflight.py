@@ -0,0 +1,134 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import singleflight
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+class CountingEvent(threading.Event):
+    """Event that counts the callers that have started waiting on it."""
+
+    def __init__(self):
+        super().__init__()
+        self.waiters = threading.Semaphore(0)
+
+    def wait(self, timeout=None):
+        self.waiters.release()
+        return super().wait(timeout)
+
+
+@pytest.fixture
+def calls(monkeypatch) -> list:
+    """Every call SingleFlight starts, with a done event that counts who's waiting on it."""
+    started = []
+
+    class Call(singleflight._Call):
+        def __init__(self):
+            super().__init__()
+            self.done = CountingEvent()
+            started.append(self)
+
+    monkeypatch.setattr(singleflight, "_Call", Call)
+    return started
+
+
+def run_together(flight: SingleFlight, fn, callers: int = 3) -> list:
+    """Call flight.do("key", fn) from several threads at once. Returns each caller's result or exception."""
+    def call():
+        try:
+            return flight.do("key", fn)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(callers) as pool:
+        futures = [pool.submit(call) for _ in range(callers)]
+        return [future.result(5) for future in futures]
+
+
+def wait_for_followers(call, count: int):
+    for _ in range(count):
+        assert call.done.waiters.acquire(timeout=5)
+
+
+def test_concurrent_callers_share_one_result(calls):
+    flight = SingleFlight()
+
+    def edit():
+        wait_for_followers(calls[0], 2)
+        return "edited"
+
+    outcomes = run_together(flight, edit)
+
+    assert len(calls) == 1
+    assert sorted(outcomes, key=lambda o: o[1]) == [("edited", False), ("edited", True), ("edited", True)]
+    assert flight.in_flight() == 0
+
+
+def test_concurrent_callers_share_one_error(calls):
+    flight = SingleFlight()
+    error = RuntimeError("Gemini failed")
+
+    def edit():
+        wait_for_followers(calls[0], 2)
+        raise error
+
+    outcomes = run_together(flight, edit)
+
+    assert len(calls) == 1
+    assert outcomes == [error, error, error]
+    assert flight.in_flight() == 0
+
+
+def test_later_calls_run_again():
+    flight = SingleFlight()
+    calls = []
+
+    flight.do("key", calls.append, 1)
+    result = flight.do("key", calls.append, 2)
+
+    assert calls == [1, 2]
+    assert result == (None, False)
+
+
+def test_async_callers_share_one_result_and_one_error():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def edit(error=None):
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        if error:
+            raise error
+        return "edited"
+
+    async def run():
+        results = await asyncio.gather(*(flight.do("ok", edit) for _ in range(3)))
+        errors = await asyncio.gather(*(flight.do("bad", edit, ValueError("no")) for _ in range(3)), return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert results == [("edited", False), ("edited", True), ("edited", True)]
+    assert len({id(e) for e in errors}) == 1 and isinstance(errors[0], ValueError)
+    assert flight.in_flight() == 0
+
+
+def test_async_waiter_giving_up_doesnt_cancel_the_call():
+    flight = AsyncSingleFlight()
+
+    async def edit():
+        await asyncio.sleep(0.1)
+        return "edited"
+
+    async def run():
+        leader = asyncio.ensure_future(flight.do("key", edit))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flight.do("key", edit), 0.01)
+        return await leader
+
+    assert asyncio.run(run()) == ("edited", False)
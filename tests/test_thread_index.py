@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+import pytest
+
+from thread_index import SharedThreadImageIndex, ThreadImageIndex
+
+
+@pytest.fixture(params=["memory", "shared"])
+def index(request, tmp_path):
+    if request.param == "memory":
+        return ThreadImageIndex()
+    return SharedThreadImageIndex(str(tmp_path / "queue.db"))
+
+
+def test_records_latest_image_with_who_posted_it(index):
+    index.record("C1", "100.0", "https://files/user.png", "101.0")
+    index.record("C1", "100.0", "https://files/bot.png", "102.0", own=True)
+
+    entry = index.get("C1", "100.0")
+
+    assert (entry["url"], entry["ts"], entry["own"]) == ("https://files/bot.png", "102.0", True)
+    assert time.time() - entry["seen"] < 5
+
+
+def test_older_images_never_replace_newer_ones(index):
+    index.record("C1", "100.0", "https://files/new.png", "105.0")
+    index.record("C1", "100.0", "https://files/old.png", "101.0")
+
+    assert index.get("C1", "100.0")["url"] == "https://files/new.png"
+    assert index.get("C1", "999.0") is None
+
+
+def test_shared_index_adds_the_own_column_to_an_existing_table(tmp_path):
+    path = str(tmp_path / "queue.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE thread_images (key TEXT PRIMARY KEY, url TEXT NOT NULL, ts TEXT NOT NULL, seen REAL NOT NULL)")
+    db.execute("INSERT INTO thread_images VALUES ('C1:100.0', 'https://files/a.png', '101.0', 0)")
+    db.commit()
+    db.close()
+
+    index = SharedThreadImageIndex(path)
+
+    assert index.get("C1", "100.0")["own"] is False
+    index.record("C1", "100.0", "https://files/b.png", "102.0", own=True)
+    assert index.get("C1", "100.0")["own"] is True
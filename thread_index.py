@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class ThreadImageIndex:
+    """Remembers the latest image in each thread, so replies only read the thread from there on.
+
+    Entries map "channel:thread_ts" to {"url", "ts", "seen", "own"}: "seen" is when
+    we recorded it and "own" whether it's the bot's upload, so callers can tell
+    how far to trust it. The index is kept warm from events and uploads the bot
+    already sees, and is flushed to a JSON file in the background so restarts
+    don't start cold.
+    """
+
+    def __init__(self, path: str | None = None, max_threads: int = 5000, flush_interval: float = 5.0):
+        self.path = path
+        self.max_threads = max_threads
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher = None  # started by the first record, so an index nobody writes to costs no thread
+
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def get(self, channel_id: str, thread_ts: str) -> dict | None:
+        key = f"{channel_id}:{thread_ts}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def record(self, channel_id: str, thread_ts: str, url: str, ts: str, own: bool = False):
+        """Note an image posted in a thread (by the bot if `own`). Older images never replace newer ones."""
+        key = f"{channel_id}:{thread_ts}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and float(entry["ts"]) > float(ts):
+                return
+            self._entries[key] = {"url": url, "ts": ts, "seen": time.time(), "own": own}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_threads:
+                self._entries.popitem(last=False)
+            self._dirty = True
+            if self.path and self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="banana-thread-index", daemon=True)
+                self._flusher.start()
+
+    def save(self):
+        """Write the index to disk if anything changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = list(self._entries.items())
+            self._dirty = False
+
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving thread index: {e}")
+            with self._lock:
+                self._dirty = True
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error loading thread index: {e}")
+            return
+        for key, entry in snapshot[-self.max_threads:]:
+            self._entries[key] = entry
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.save()
+
+
+class SharedThreadImageIndex:
+    """ThreadImageIndex kept in a SQLite file, for when several processes post to the same threads."""
+
+    def __init__(self, path: str, max_threads: int = 5000):
+        self.path = path
+        self.max_threads = max_threads
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._db()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS thread_images (key TEXT PRIMARY KEY, url TEXT NOT NULL, ts TEXT NOT NULL, seen REAL NOT NULL, own INTEGER NOT NULL DEFAULT 0)"
+        )
+        if "own" not in [column[1] for column in db.execute("PRAGMA table_info(thread_images)")]:
+            db.execute("ALTER TABLE thread_images ADD COLUMN own INTEGER NOT NULL DEFAULT 0")
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def get(self, channel_id: str, thread_ts: str) -> dict | None:
+        row = self._db().execute("SELECT url, ts, seen, own FROM thread_images WHERE key = ?", (f"{channel_id}:{thread_ts}",)).fetchone()
+        return {"url": row[0], "ts": row[1], "seen": row[2], "own": bool(row[3])} if row else None
+
+    def record(self, channel_id: str, thread_ts: str, url: str, ts: str, own: bool = False):
+        """Note an image posted in a thread (by the bot if `own`). Older images never replace newer ones."""
+        db = self._db()
+        db.execute(
+            """INSERT INTO thread_images (key, url, ts, seen, own) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (key) DO UPDATE SET url = excluded.url, ts = excluded.ts, seen = excluded.seen, own = excluded.own
+               WHERE CAST(excluded.ts AS REAL) >= CAST(thread_images.ts AS REAL)""",
+            (f"{channel_id}:{thread_ts}", url, ts, time.time(), int(own)),
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            db.execute(
+                "DELETE FROM thread_images WHERE key NOT IN (SELECT key FROM thread_images ORDER BY seen DESC LIMIT ?)",
+                (self.max_threads,),
+            )
+
+    def save(self):
+        pass  # every record is already on disk
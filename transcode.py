@@ -0,0 +1,57 @@
+import io
+from PIL import Image
+
+FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+def _encode(image: Image.Image, fmt: str, quality: int, fast: bool = False) -> bytes:
+    """Encode at a quality. `fast` skips the slow size optimizations, for probing sizes."""
+    out = io.BytesIO()
+    if fmt == "JPEG":
+        image.save(out, format="JPEG", quality=quality, optimize=not fast, progressive=not fast)
+    else:
+        image.save(out, format="WEBP", quality=quality, method=0 if fast else 4)
+    return out.getvalue()
+
+
+def transcode_output(data: bytes, mime_type: str | None, fmt: str = "jpeg", max_bytes: int = 3 * 1024 * 1024,
+                     min_quality: int = 60, max_quality: int = 92) -> tuple[bytes, str | None]:
+    """Re-encode a model output as JPEG or WebP at the best quality that fits in max_bytes.
+
+    Returns the original (data, mime_type) if the format is "png", it can't be
+    decoded, or the re-encode wouldn't be smaller. If even min_quality doesn't
+    fit, the min_quality version is used.
+    """
+    if fmt not in FORMATS:
+        return data, mime_type
+    pil_format, new_type = FORMATS[fmt]
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        if has_alpha and pil_format == "JPEG":
+            pil_format, new_type = FORMATS["webp"]  # JPEG would lose the transparency
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+        # Search with fast encodes, then do one full encode at the quality found
+        best_quality, probe = max_quality, _encode(image, pil_format, max_quality, fast=True)
+        if len(probe) > max_bytes:
+            low, high = min_quality, max_quality - 1
+            best_quality = min_quality
+            while low <= high:
+                quality = (low + high) // 2
+                encoded = _encode(image, pil_format, quality, fast=True)
+                if len(encoded) <= max_bytes:
+                    best_quality, probe, low = quality, encoded, quality + 1
+                else:
+                    high = quality - 1
+        best = _encode(image, pil_format, best_quality)
+        if len(best) > len(probe):
+            best = probe
+    except Exception as e:
+        print(f"Couldn't transcode {mime_type} output: {e}")
+        return data, mime_type
+
+    if len(best) >= len(data):
+        return data, mime_type
+    return best, new_type